@@ -0,0 +1,67 @@
+"""
+Views for the OpenAPI schema and its documentation.
+
+The schema is generated at build time with
+``python manage.py spectacular --file <OPENAPI_SCHEMA_PATH>`` and served from
+that file. drf-spectacular is only installed for that command and when
+SERVE_API_DOCS is set, which keeps it out of the worker's startup. Only then
+can the schema be generated on request and the docs be served.
+"""
+
+import hashlib
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import condition, require_safe
+
+_schema = None
+
+
+def can_generate():
+    return apps.is_installed("drf_spectacular")
+
+
+def load_schema():
+    """Returns the (content, etag) of the precomputed schema, or None if there is none."""
+    global _schema
+    if _schema is None:
+        path = Path(settings.OPENAPI_SCHEMA_PATH)
+        if not path.is_file():
+            return None
+        content = path.read_bytes()
+        _schema = (content, f'"{hashlib.sha256(content).hexdigest()}"')
+    return _schema
+
+
+def schema_etag(request):
+    schema = load_schema()
+    if schema is None or (request.GET and can_generate()):
+        return None
+    return schema[1]
+
+
+@require_safe
+@condition(etag_func=schema_etag)
+def schema_view(request):
+    schema = load_schema()
+    # Query parameters (format, lang, ...) need the schema to be generated.
+    if schema is None or (request.GET and can_generate()):
+        if not can_generate():
+            raise Http404("The OpenAPI schema has not been generated.")
+        from drf_spectacular.views import SpectacularAPIView
+
+        return SpectacularAPIView.as_view()(request)
+
+    response = HttpResponse(schema[0], content_type="application/vnd.oai.openapi")
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+def docs_view(request):
+    if not can_generate():
+        raise Http404("The API docs are only served with SERVE_API_DOCS.")
+    from drf_spectacular.views import SpectacularSwaggerView
+
+    return SpectacularSwaggerView.as_view(url_name="schema")(request)
@@ -12,13 +12,14 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from environ import Env
 
 env = Env()
 env.read_env()
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
-# BASE_DIR = Path(__file__).resolve().parent.parent
+BASE_DIR = Path(__file__).resolve().parent.parent
 
 
 # Quick-start development settings - unsuitable for production
@@ -43,15 +44,22 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "rest_framework",
-    "drf_spectacular",
     "traffic_data_app",
     "django_filters",
     "rest_framework.authtoken",
     "django.contrib.gis",
 ]
 
+# drf-spectacular imports its generator, YAML and all of its contrib modules
+# as soon as its app is ready, so it is only installed to generate the schema
+# (the spectacular command) and where SERVE_API_DOCS asks for the docs.
+SERVE_API_DOCS = env.bool("SERVE_API_DOCS", default=False)
+if SERVE_API_DOCS or sys.argv[1:2] == ["spectacular"]:
+    INSTALLED_APPS.insert(INSTALLED_APPS.index("rest_framework") + 1, "drf_spectacular")
+
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "traffic_data_app.throttling.ConcurrencyLimitMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -91,8 +99,8 @@ DATABASES = {
         "NAME": env.str("POSTGRES_DB"),
         "USER": env.str("POSTGRES_USER"),
         "PASSWORD": env.str("POSTGRES_PASSWORD"),
-        "HOST": "db",
-        "PORT": "5432",
+        "HOST": env.str("DB_HOST", default="db"),
+        "PORT": env.str("DB_PORT", default="5432"),
     }
 }
 
@@ -145,6 +153,9 @@ SPECTACULAR_SETTINGS = {
     "SERVE_INCLUDE_SCHEMA": False,
 }
 
+# Schema generated at build time with `manage.py spectacular --file`, served by /api/schema/
+OPENAPI_SCHEMA_PATH = env.str("OPENAPI_SCHEMA_PATH", default=str(BASE_DIR / "openapi-schema.yml"))
+
 # Configure GDAL Library Path for Docker
 GDAL_LIBRARY_PATH = "/usr/lib/libgdal.so"
 
@@ -160,6 +171,46 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'traffic_data_app.renderers.ORJSONRenderer',
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'traffic_data_app.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'traffic_data_app.throttling.TokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'read': '1200/min',
+        'expensive': '60/min',
+        'write': '600/min',
+    },
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
 }
+
+# Seconds between refreshes of the routing graph with new readings
+ROUTING_REFRESH_INTERVAL = 5
+
+# Seconds without readings after which a gap is recorded for a segment
+SENSOR_GAP_THRESHOLD = 15 * 60
+
+# Seconds without readings after which /api/roadsegments/stale/ lists a segment
+SENSOR_STALE_AFTER = 60 * 60
+
+# Readings applied per statement by update_coverage, and the minimum time in
+# seconds between seeing a reading and applying it. Readings of transactions
+# still in flight are held back for as long as the transactions run.
+COVERAGE_BATCH_SIZE = 1_000_000
+COVERAGE_SETTLE_SECONDS = 10
+
+# Where the throttling token buckets are kept. CacheBucketStore shares them
+# between processes through the Django cache.
+THROTTLE_BUCKET_STORE = "traffic_data_app.throttling.LocalBucketStore"
+
+# Maximum number of concurrent API requests per class in every process
+CONCURRENCY_LIMITS = {
+    "read": 64,
+    "expensive": 8,
+    "write": 16,
+}
@@ -17,15 +17,11 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from .schema import docs_view, schema_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("traffic_data_app.urls")),
-    path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
-    path(
-        "api/docs/",
-        SpectacularSwaggerView.as_view(url_name="schema"),
-        name="swagger-ui",
-    ),
+    path("api/schema/", schema_view, name="schema"),
+    path("api/docs/", docs_view, name="swagger-ui"),
 ]
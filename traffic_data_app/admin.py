@@ -1,3 +1,149 @@
+import json
+from datetime import date, datetime, time, timedelta
+
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.gis.admin import GISModelAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import RoadSegment, TrafficReading
+
+# Below this many estimated rows, the changelist counts its rows exactly.
+ESTIMATED_COUNT_THRESHOLD = 100_000
+
+
+def estimated_count(queryset):
+    """Returns the number of rows the planner expects the queryset to return."""
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that uses the planner's row estimate instead of COUNT(*) on
+    large tables. The estimate follows the changelist filters and is only
+    as accurate as the table statistics.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate < ESTIMATED_COUNT_THRESHOLD:
+            return super().count
+        return estimate
+
+
+def other_filter_params(changelist, names):
+    """Returns the (name, value) pairs of the changelist filters not in `names`."""
+    return [
+        (key, value)
+        for key, values in changelist.get_filters_params().items()
+        if key not in names
+        for value in (values if isinstance(values, list) else [values])
+    ]
+
+
+class SegmentFilter(admin.SimpleListFilter):
+    """Filters readings by segment id from a text box rather than a list of every segment."""
+
+    title = "segment"
+    parameter_name = "segment"
+    template = "admin/traffic_data_app/input_filter.html"
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        # Only used by the template to render the inputs and keep the other filters.
+        yield {
+            "fields": [("number", self.parameter_name, self.value() or "", "Segment id")],
+            "query_parts": other_filter_params(changelist, {self.parameter_name}),
+        }
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value and value.isdigit():
+            return queryset.filter(segment_id=int(value))
+        return queryset
+
+
+class TimestampRangeFilter(admin.ListFilter):
+    """
+    Filters readings by a range of days with plain comparisons on the
+    indexed timestamp. Unlike date_hierarchy, it never lists the distinct
+    dates of the table.
+    """
+
+    title = "date"
+    template = "admin/traffic_data_app/input_filter.html"
+    parameters = ("timestamp_from", "timestamp_to")
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        self.values = {}
+        for name in self.parameters:
+            if name in params:
+                value = params.pop(name)
+                self.values[name] = value[-1] if isinstance(value, list) else value
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return list(self.parameters)
+
+    def choices(self, changelist):
+        yield {
+            "fields": [
+                ("date", name, self.values.get(name, ""), label)
+                for name, label in zip(self.parameters, ("From", "To"))
+            ],
+            "query_parts": other_filter_params(changelist, set(self.parameters)),
+        }
+
+    def queryset(self, request, queryset):
+        try:
+            days = {name: date.fromisoformat(value) for name, value in self.values.items() if value}
+        except ValueError as e:
+            raise IncorrectLookupParameters(e)
+
+        def start_of(day):
+            return timezone.make_aware(datetime.combine(day, time.min))
+
+        if "timestamp_from" in days:
+            queryset = queryset.filter(timestamp__gte=start_of(days["timestamp_from"]))
+        if "timestamp_to" in days:
+            queryset = queryset.filter(timestamp__lt=start_of(days["timestamp_to"] + timedelta(days=1)))
+        return queryset
+
+
+@admin.register(RoadSegment)
+class RoadSegmentAdmin(GISModelAdmin):
+    list_display = ("id", "name", "external_id", "length")
+    search_fields = ("name", "=external_id")
+    readonly_fields = ("uuid",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
 
-# Register your models here.
+@admin.register(TrafficReading)
+class TrafficReadingAdmin(admin.ModelAdmin):
+    list_display = ("id", "segment", "timestamp", "speed_measured")
+    # TrafficReading.__str__ and the segment column both need the segment.
+    list_select_related = ("segment",)
+    list_filter = (SegmentFilter, TimestampRangeFilter)
+    raw_id_fields = ("segment",)
+    readonly_fields = ("uuid", "timestamp")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TrafficDataAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "traffic_data_app"
+
+    def ready(self):
+        from . import signals  # noqa: F401
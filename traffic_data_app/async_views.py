@@ -0,0 +1,230 @@
+import math
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import HttpResponse
+from django.views import View
+from django_filters.utils import translate_validation
+from rest_framework import exceptions
+from rest_framework.authentication import get_authorization_header
+from rest_framework.authtoken.models import Token
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .filters import RoadSegmentFilter, TrafficReadingFilter
+from .models import RoadSegment, TrafficReading
+from .permissions import IsAdminUserOrReadOnly
+from .serializers import RoadSegmentSerializer, TrafficReadingSerializer, requested_fields
+from .throttling import TokenBucketThrottle
+
+
+async def authenticate(request):
+    """
+    Async equivalent of DRF's TokenAuthentication.
+    Returns (user, token), with an anonymous user when no token is given.
+    """
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != b"token":
+        return AnonymousUser(), None
+
+    if len(auth) == 1:
+        raise exceptions.AuthenticationFailed("Invalid token header. No credentials provided.")
+    if len(auth) > 2:
+        raise exceptions.AuthenticationFailed("Invalid token header. Token string should not contain spaces.")
+    try:
+        key = auth[1].decode()
+    except UnicodeError:
+        raise exceptions.AuthenticationFailed(
+            "Invalid token header. Token string should not contain invalid characters."
+        )
+
+    try:
+        token = await Token.objects.select_related("user").aget(key=key)
+    except Token.DoesNotExist:
+        raise exceptions.AuthenticationFailed("Invalid token.")
+    if not token.user.is_active:
+        raise exceptions.AuthenticationFailed("User inactive or deleted.")
+    return token.user, token
+
+
+class AsyncReadView(View):
+    """
+    Base class for the async read endpoints. It applies the same
+    authentication, permissions, throttling, filtering and rendering as
+    the DRF viewsets, using the async ORM for every query.
+    """
+
+    model = None
+    serializer_class = None
+    filterset_class = None
+    permission_classes = [IsAdminUserOrReadOnly]
+    throttle_classes = [TokenBucketThrottle]
+
+    async def get(self, request, *args, **kwargs):
+        drf_request = Request(request)
+        headers = {}
+        try:
+            await self.initial(drf_request)
+            data = await self.read(drf_request, *args, **kwargs)
+            status = 200
+        except exceptions.APIException as exc:
+            data, status, headers = self.handle_exception(exc)
+        return self.render(drf_request, data, status, headers)
+
+    async def initial(self, request):
+        request.user, request.auth = await authenticate(request)
+
+        for permission in self.permission_classes:
+            if not permission().has_permission(request, self):
+                if not request.user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied()
+
+        for throttle_class in self.throttle_classes:
+            throttle = throttle_class()
+            if not throttle.allow_request(request, self):
+                raise exceptions.Throttled(throttle.wait())
+
+    async def read(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    def get_queryset(self, request):
+        queryset = self.model.objects.all()
+        fields = requested_fields(request)
+        if fields is not None:
+            queryset = queryset.only(*self.serializer_class.get_columns(fields))
+        return queryset
+
+    async def filter_queryset(self, request, queryset):
+        filterset = self.filterset_class(request.query_params, queryset=queryset, request=request)
+        # Validating a model choice filter queries the database.
+        if not await sync_to_async(filterset.is_valid)():
+            raise translate_validation(filterset.errors)
+        return filterset.qs
+
+    async def get_object(self, request, pk):
+        queryset = await self.filter_queryset(request, self.get_queryset(request))
+        try:
+            return await queryset.aget(pk=pk)
+        except (self.model.DoesNotExist, TypeError, ValueError, DjangoValidationError):
+            raise exceptions.NotFound(
+                f"No {self.model._meta.object_name} matches the given query."
+            )
+
+    def serialize(self, request, instance, many=False):
+        return self.serializer_class(instance, many=many, context={"request": request}).data
+
+    def handle_exception(self, exc):
+        """Returns the data, status and headers DRF would respond with."""
+        if isinstance(exc.detail, (list, dict)):
+            data = exc.detail
+        else:
+            data = {"detail": exc.detail}
+        headers = {}
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            exc.status_code = 401
+            headers["WWW-Authenticate"] = "Token"
+        if getattr(exc, "wait", None):
+            headers["Retry-After"] = str(math.ceil(exc.wait))
+        return data, exc.status_code, headers
+
+    def render(self, request, data, status, headers):
+        renderers = [
+            renderer()
+            for renderer in api_settings.DEFAULT_RENDERER_CLASSES
+            if not issubclass(renderer, BrowsableAPIRenderer)
+        ]
+        try:
+            renderer, media_type = DefaultContentNegotiation().select_renderer(request, renderers)
+        except exceptions.NotAcceptable:
+            renderer, media_type = renderers[0], renderers[0].media_type
+            data, status = {"detail": "Could not satisfy the request Accept header."}, 406
+
+        content_type = media_type
+        if renderer.charset:
+            content_type = f"{media_type}; charset={renderer.charset}"
+        response = HttpResponse(
+            renderer.render(data, media_type, {"request": request}),
+            status=status,
+            content_type=content_type,
+        )
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+
+class AsyncListView(AsyncReadView):
+    """Paginated list, with the same shape as DRF's PageNumberPagination."""
+
+    async def read(self, request):
+        queryset = await self.filter_queryset(request, self.get_queryset(request))
+        page_size = api_settings.PAGE_SIZE
+
+        count = await queryset.acount()
+        num_pages = max(1, math.ceil(count / page_size))
+        page = request.query_params.get("page", 1)
+        if page == "last":
+            page = num_pages
+        try:
+            page = int(page)
+        except (TypeError, ValueError):
+            raise exceptions.NotFound("Invalid page.")
+        if page < 1 or page > num_pages:
+            raise exceptions.NotFound("Invalid page.")
+
+        offset = (page - 1) * page_size
+        results = [obj async for obj in queryset[offset:offset + page_size]]
+
+        url = request.build_absolute_uri()
+        next_url = replace_query_param(url, "page", page + 1) if page < num_pages else None
+        previous_url = None
+        if page == 2:
+            previous_url = remove_query_param(url, "page")
+        elif page > 2:
+            previous_url = replace_query_param(url, "page", page - 1)
+
+        return {
+            "count": count,
+            "next": next_url,
+            "previous": previous_url,
+            "results": self.serialize(request, results, many=True),
+        }
+
+
+class AsyncDetailView(AsyncReadView):
+    async def read(self, request, pk):
+        return self.serialize(request, await self.get_object(request, pk))
+
+
+class RoadSegmentAsyncListView(AsyncListView):
+    model = RoadSegment
+    serializer_class = RoadSegmentSerializer
+    filterset_class = RoadSegmentFilter
+
+
+class RoadSegmentAsyncDetailView(AsyncDetailView):
+    model = RoadSegment
+    serializer_class = RoadSegmentSerializer
+    filterset_class = RoadSegmentFilter
+
+
+class RoadSegmentAsyncReadingsCountView(RoadSegmentAsyncDetailView):
+    async def read(self, request, pk):
+        segment = await self.get_object(request, pk)
+        return {"readings_count": await segment.traffic_readings.acount()}
+
+
+class TrafficReadingAsyncListView(AsyncListView):
+    model = TrafficReading
+    serializer_class = TrafficReadingSerializer
+    filterset_class = TrafficReadingFilter
+
+
+class TrafficReadingAsyncDetailView(AsyncDetailView):
+    model = TrafficReading
+    serializer_class = TrafficReadingSerializer
+    filterset_class = TrafficReadingFilter
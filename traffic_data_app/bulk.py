@@ -0,0 +1,103 @@
+import uuid
+
+from django.db import connection, transaction
+
+from . import heatmap
+from .models import RoadSegment, SegmentLatestState
+from .routing import network_changed
+
+# Unique columns a bulk upsert can match existing segments by.
+UPSERT_KEYS = ("uuid", "external_id")
+
+# Columns of the VALUES list sent to the database, in order.
+VALUE_COLUMNS = (
+    "uuid",
+    "external_id",
+    "name",
+    "long_start",
+    "lat_start",
+    "long_end",
+    "lat_end",
+    "length",
+)
+
+
+def upsert_segments(key, segments):
+    """
+    Creates or updates road segments matched by `key` ('uuid' or
+    'external_id') with a single INSERT ... ON CONFLICT DO UPDATE.
+    Geometries are built by PostGIS. In the same transaction, the latest
+    state and heatmap cells of the changed segments are updated and the
+    routing graphs are marked as out of date.
+    Returns a list of (id, uuid, external_id, created) tuples.
+    """
+    if key not in UPSERT_KEYS:
+        raise ValueError(f"Segments can only be matched by {', '.join(UPSERT_KEYS)}.")
+
+    segment_table = RoadSegment._meta.db_table
+    state_table = SegmentLatestState._meta.db_table
+
+    params = []
+    for segment in segments:
+        params.extend((
+            str(segment.get("uuid") or uuid.uuid4()),
+            segment.get("external_id"),
+            segment["name"],
+            segment["long_start_write"],
+            segment["lat_start_write"],
+            segment["long_end_write"],
+            segment["lat_end_write"],
+            segment["length"],
+        ))
+    row = "(%s::uuid, %s, %s, %s::float8, %s::float8, %s::float8, %s::float8, %s::float8)"
+    values = ", ".join([row] * len(segments))
+
+    # Updating never changes the uuid or external_id a segment is known by.
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {segment_table} (uuid, external_id, name, geometry, length)
+            SELECT v.uuid, v.external_id, v.name,
+                   ST_SetSRID(ST_MakeLine(
+                       ST_MakePoint(v.long_start, v.lat_start),
+                       ST_MakePoint(v.long_end, v.lat_end)
+                   ), 4326),
+                   v.length
+            FROM (VALUES {values}) AS v({", ".join(VALUE_COLUMNS)})
+            ON CONFLICT ({key}) DO UPDATE SET
+                name = EXCLUDED.name,
+                geometry = EXCLUDED.geometry,
+                length = EXCLUDED.length
+            RETURNING id, uuid, external_id, (xmax = 0) AS created
+            """,
+            params,
+        )
+        rows = cursor.fetchall()
+        segment_ids = [row[0] for row in rows]
+
+        # Move the changed segments to the heatmap cells of their new geometry.
+        cursor.execute(
+            f"SELECT geohash FROM {state_table} WHERE segment_id = ANY(%s)", [segment_ids]
+        )
+        prefixes = set()
+        for (old_geohash,) in cursor.fetchall():
+            prefixes |= heatmap.cell_prefixes(old_geohash)
+
+        cursor.execute(
+            f"""
+            INSERT INTO {state_table}
+                (segment_id, geohash, speed, timestamp, reading_count, speed_sum, dirty)
+            SELECT id, ST_GeoHash(ST_Centroid(geometry), 12), NULL, NULL, 0, 0, false
+            FROM {segment_table} WHERE id = ANY(%s)
+            ON CONFLICT (segment_id) DO UPDATE SET geohash = EXCLUDED.geohash
+            RETURNING geohash
+            """,
+            [segment_ids],
+        )
+        for (new_geohash,) in cursor.fetchall():
+            prefixes |= heatmap.cell_prefixes(new_geohash)
+
+        heatmap.recompute_cells(prefixes)
+        network_changed()
+
+    return rows
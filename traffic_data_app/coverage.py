@@ -0,0 +1,157 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import CoverageWatermark, SegmentCoverage, SensorGap, TrafficReading
+from .visibility import reading_snapshot
+
+
+def update(batch_size=None):
+    """
+    Applies the readings created since the last run to the coverage and gap
+    tables, in batches of reading ids. Returns the number of readings applied.
+    """
+    batch_size = batch_size or settings.COVERAGE_BATCH_SIZE
+    horizon = advance_horizon()
+    total = 0
+    while True:
+        applied = update_batch(batch_size, horizon)
+        if not applied:
+            return total
+        total += applied
+
+
+def advance_horizon():
+    """
+    Moves the horizon up to the pending one once it is safe, captures a new
+    pending horizon and returns the horizon.
+
+    A reading may become visible after readings with higher ids were applied.
+    The pending horizon is the highest visible reading id, with the xmax of the
+    snapshot it was seen in (see visibility.reading_snapshot). Once the xmin of
+    the current snapshot has reached it, however long those transactions took,
+    every reading up to the pending horizon is committed or gone.
+    COVERAGE_SETTLE_SECONDS covers transactions that drew an id but had not yet
+    been given a transaction id.
+    """
+    settled = timezone.now() - timedelta(seconds=settings.COVERAGE_SETTLE_SECONDS)
+
+    with transaction.atomic():
+        # Locking the watermark keeps concurrent runs from applying a batch twice.
+        watermark, _ = CoverageWatermark.objects.select_for_update().get_or_create(pk=1)
+        last_id, xmin, xmax = reading_snapshot()
+
+        if (
+            watermark.pending_reading_id is not None
+            and watermark.pending_at <= settled
+            and xmin >= watermark.pending_xmax
+        ):
+            watermark.horizon_reading_id = watermark.pending_reading_id
+            watermark.pending_reading_id = None
+
+        if watermark.pending_reading_id is None:
+            watermark.pending_reading_id = last_id
+            watermark.pending_xmax = xmax
+            watermark.pending_at = timezone.now()
+            watermark.save()
+
+    return watermark.horizon_reading_id
+
+
+def update_batch(batch_size, horizon):
+    """
+    Applies the next batch of readings after the watermark, up to the horizon,
+    with one set-based statement, and moves the watermark past them.
+    """
+    reading_table = TrafficReading._meta.db_table
+    coverage_table = SegmentCoverage._meta.db_table
+    gap_table = SensorGap._meta.db_table
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        watermark = CoverageWatermark.objects.select_for_update().get(pk=1)
+
+        cursor.execute(
+            f"""
+            SELECT COUNT(*), MAX(id) FROM (
+                SELECT id FROM {reading_table} WHERE id > %s AND id <= %s
+                ORDER BY id LIMIT %s
+            ) batch
+            """,
+            [watermark.last_reading_id, horizon, batch_size],
+        )
+        count, last_id = cursor.fetchone()
+        if not count:
+            return 0
+
+        # The last reading seen of each segment seeds LAG(), so gaps spanning two
+        # batches are found without rescanning old readings. Readings older than
+        # that arrived late and are counted, but cannot open a gap.
+        cursor.execute(
+            f"""
+            WITH new AS (
+                SELECT id, segment_id, timestamp FROM {reading_table}
+                WHERE id > %s AND id <= %s
+            ),
+            events AS (
+                SELECT n.id, n.segment_id, n.timestamp FROM new n
+                LEFT JOIN {coverage_table} c ON c.segment_id = n.segment_id
+                WHERE c.last_seen IS NULL OR n.timestamp >= c.last_seen
+                UNION ALL
+                SELECT NULL, c.segment_id, c.last_seen FROM {coverage_table} c
+                WHERE c.segment_id IN (SELECT segment_id FROM new)
+            ),
+            lagged AS (
+                SELECT id, segment_id, timestamp,
+                       LAG(timestamp) OVER (
+                           PARTITION BY segment_id ORDER BY timestamp, id NULLS FIRST
+                       ) AS previous
+                FROM events
+            ),
+            gaps AS (
+                INSERT INTO {gap_table} (segment_id, started_at, ended_at, duration)
+                SELECT segment_id, previous, timestamp, timestamp - previous FROM lagged
+                WHERE id IS NOT NULL AND timestamp - previous > %s
+                RETURNING segment_id, duration
+            ),
+            gap_totals AS (
+                SELECT segment_id, COUNT(*) AS gap_count, SUM(duration) AS total_gap,
+                       MAX(duration) AS longest_gap
+                FROM gaps GROUP BY segment_id
+            )
+            INSERT INTO {coverage_table} AS c
+                (segment_id, first_seen, last_seen, reading_count, gap_count, total_gap, longest_gap)
+            SELECT n.segment_id, MIN(n.timestamp), MAX(n.timestamp), COUNT(*),
+                   COALESCE(MAX(g.gap_count), 0), COALESCE(MAX(g.total_gap), interval '0'),
+                   MAX(g.longest_gap)
+            FROM new n LEFT JOIN gap_totals g ON g.segment_id = n.segment_id
+            GROUP BY n.segment_id
+            ON CONFLICT (segment_id) DO UPDATE SET
+                first_seen = LEAST(c.first_seen, EXCLUDED.first_seen),
+                last_seen = GREATEST(c.last_seen, EXCLUDED.last_seen),
+                reading_count = c.reading_count + EXCLUDED.reading_count,
+                gap_count = c.gap_count + EXCLUDED.gap_count,
+                total_gap = c.total_gap + EXCLUDED.total_gap,
+                longest_gap = GREATEST(c.longest_gap, EXCLUDED.longest_gap)
+            """,
+            [
+                watermark.last_reading_id,
+                last_id,
+                timedelta(seconds=settings.SENSOR_GAP_THRESHOLD),
+            ],
+        )
+
+        watermark.last_reading_id = last_id
+        watermark.save(update_fields=["last_reading_id"])
+
+    return count
+
+
+def rebuild(batch_size=None):
+    """Drops the coverage and gap tables and applies every reading again."""
+    with transaction.atomic():
+        SensorGap.objects.all().delete()
+        SegmentCoverage.objects.all().delete()
+        CoverageWatermark.objects.update_or_create(pk=1, defaults={"last_reading_id": 0})
+    return update(batch_size)
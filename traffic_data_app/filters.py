@@ -34,4 +34,14 @@ class RoadSegmentFilter(django_filters.FilterSet):
         queryset = queryset.annotate(
             last_reading_id=Subquery(last_reading_subquery)
         )
-        return queryset.filter(last_reading_id__isnull=False)
\ No newline at end of file
+        return queryset.filter(last_reading_id__isnull=False)
+
+
+class TrafficReadingFilter(django_filters.FilterSet):
+    """
+    A filter set for TrafficReading to filter by road segment.
+    """
+
+    class Meta:
+        model = TrafficReading
+        fields = ['segment']
@@ -0,0 +1,79 @@
+import math
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode(lon, lat, precision):
+    """Returns the geohash of a point, matching PostGIS' ST_GeoHash."""
+    lon_range, lat_range = [-180.0, 180.0], [-90.0, 90.0]
+    chars = []
+    bits, value, even = 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if lon >= mid:
+                value = value * 2 + 1
+                lon_range[0] = mid
+            else:
+                value *= 2
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if lat >= mid:
+                value = value * 2 + 1
+                lat_range[0] = mid
+            else:
+                value *= 2
+                lat_range[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """Returns the (width, height) in degrees of the cells of a precision."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 360.0 / 2 ** lon_bits, 180.0 / 2 ** lat_bits
+
+
+def bounds(geohash):
+    """Returns the (west, south, east, north) bounds of a geohash cell."""
+    width, height = cell_size(len(geohash))
+    lon_range, lat_range = [-180.0, 180.0], [-90.0, 90.0]
+    even = True
+    for char in geohash:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            target = lon_range if even else lat_range
+            mid = (target[0] + target[1]) / 2
+            target[1 - bit] = mid
+            even = not even
+    return lon_range[0], lat_range[0], lon_range[0] + width, lat_range[0] + height
+
+
+def cover(west, south, east, north, precision, max_cells):
+    """
+    Returns the geohashes of every cell of a precision that overlaps the
+    bounding box. Raises ValueError if there would be more than max_cells.
+    """
+    width, height = cell_size(precision)
+    columns = 2 ** ((5 * precision + 1) // 2)
+    rows = 2 ** (5 * precision // 2)
+
+    x0 = max(0, math.floor((west + 180) / width))
+    x1 = min(columns - 1, math.floor((east + 180) / width))
+    y0 = max(0, math.floor((south + 90) / height))
+    y1 = min(rows - 1, math.floor((north + 90) / height))
+    if (x1 - x0 + 1) * (y1 - y0 + 1) > max_cells:
+        raise ValueError("The bounding box covers too many cells for this zoom.")
+
+    return [
+        encode(-180 + (x + 0.5) * width, -90 + (y + 0.5) * height, precision)
+        for x in range(x0, x1 + 1)
+        for y in range(y0, y1 + 1)
+    ]
@@ -0,0 +1,226 @@
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+
+from . import geohash
+from .models import HeatmapCell, RoadSegment, SegmentLatestState, TrafficReading
+
+# Geohash precisions at which cells are maintained, from ~630 km to ~150 m wide.
+PRECISIONS = range(2, 8)
+
+# Largest number of cells returned for one viewport.
+MAX_CELLS = 4096
+
+# Above this many cells, recompute_cells scans the latest states once instead
+# of looking every cell up through the geohash index.
+MAX_INDEXED_CELLS = 200
+
+
+def precision_for_zoom(zoom):
+    """Maps a web map zoom level (0-20) to a geohash precision."""
+    return min(max(zoom // 3 + 1, PRECISIONS[0]), PRECISIONS[-1])
+
+
+def cell_prefixes(segment_geohash):
+    return {segment_geohash[:precision] for precision in PRECISIONS}
+
+
+def segment_geohash(segment):
+    centroid = segment.geometry.centroid
+    return geohash.encode(centroid.x, centroid.y, 12)
+
+
+def recompute_cells(prefixes):
+    """Recomputes the given cells from the latest state of their segments."""
+    if len(prefixes) > MAX_INDEXED_CELLS:
+        recompute_many_cells(prefixes)
+        return
+
+    for prefix in prefixes:
+        totals = SegmentLatestState.objects.filter(geohash__startswith=prefix).aggregate(
+            segments=Count("pk"),
+            reporting=Count("speed"),
+            speed_sum=Sum("speed"),
+            readings=Sum("reading_count"),
+        )
+        if not totals["segments"]:
+            HeatmapCell.objects.filter(geohash=prefix).delete()
+            continue
+
+        HeatmapCell.objects.update_or_create(
+            geohash=prefix,
+            defaults={
+                "precision": len(prefix),
+                "segment_count": totals["segments"],
+                "reporting_count": totals["reporting"],
+                "speed_sum": totals["speed_sum"] or 0,
+                "reading_count": totals["readings"] or 0,
+            },
+        )
+
+
+def recompute_many_cells(prefixes):
+    """
+    Recomputes the given cells with one pass over the latest states, which is
+    cheaper than one indexed lookup per cell when many cells change at once.
+    """
+    state_table = SegmentLatestState._meta.db_table
+    cell_table = HeatmapCell._meta.db_table
+    prefixes = list(prefixes)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {cell_table} WHERE geohash = ANY(%s)", [prefixes])
+        cursor.execute(
+            f"""
+            INSERT INTO {cell_table}
+                (geohash, precision, segment_count, reporting_count, speed_sum, reading_count)
+            SELECT LEFT(st.geohash, p.precision), p.precision, COUNT(*), COUNT(st.speed),
+                   COALESCE(SUM(st.speed), 0), SUM(st.reading_count)
+            FROM {state_table} st CROSS JOIN unnest(%s::int[]) AS p(precision)
+            WHERE LEFT(st.geohash, p.precision) = ANY(%s)
+            GROUP BY p.precision, LEFT(st.geohash, p.precision)
+            """,
+            [list(PRECISIONS), prefixes],
+        )
+
+
+def refresh_segment(segment_id):
+    """
+    Recomputes the latest state of a segment from its readings, and the
+    cells it was and is now part of. Used when the network changes.
+    """
+    with transaction.atomic():
+        previous = SegmentLatestState.objects.filter(segment_id=segment_id).first()
+        prefixes = cell_prefixes(previous.geohash) if previous else set()
+
+        segment = RoadSegment.objects.filter(pk=segment_id).first()
+        if segment is None:
+            SegmentLatestState.objects.filter(segment_id=segment_id).delete()
+        else:
+            latest = segment.traffic_readings.order_by("-timestamp", "-id").first()
+            totals = segment.traffic_readings.aggregate(
+                count=Count("pk"), speed_sum=Sum("speed_measured")
+            )
+            state, _ = SegmentLatestState.objects.update_or_create(
+                segment=segment,
+                defaults={
+                    "geohash": segment_geohash(segment),
+                    "speed": latest.speed_measured if latest else None,
+                    "timestamp": latest.timestamp if latest else None,
+                    "reading_count": totals["count"],
+                    "speed_sum": totals["speed_sum"] or 0,
+                },
+            )
+            prefixes |= cell_prefixes(state.geohash)
+
+        recompute_cells(prefixes)
+
+
+def segment_deleted(segment):
+    """Removes a deleted segment from the cells of its geometry."""
+    recompute_cells(cell_prefixes(segment_geohash(segment)))
+
+
+def apply_reading(reading):
+    """
+    Applies a new reading to the latest state of its segment with a single
+    UPDATE, and marks the segment so that update() folds it into its cells.
+    The shared cells are not touched, so concurrent readings only contend
+    when they are for the same segment.
+    """
+    newer = Q(timestamp__isnull=True) | Q(timestamp__lte=reading.timestamp)
+    updated = SegmentLatestState.objects.filter(segment_id=reading.segment_id).update(
+        speed=Case(When(newer, then=Value(reading.speed_measured)), default=F("speed")),
+        timestamp=Case(When(newer, then=Value(reading.timestamp)), default=F("timestamp")),
+        reading_count=F("reading_count") + 1,
+        speed_sum=F("speed_sum") + reading.speed_measured,
+        dirty=True,
+    )
+    if not updated:
+        refresh_segment(reading.segment_id)
+
+
+def update():
+    """
+    Recomputes the cells of the segments whose latest state changed since
+    the last run. Meant to be run on a schedule by update_heatmap.
+    Returns the number of segments folded in.
+    """
+    state_table = SegmentLatestState._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT segment_id, geohash, reading_count FROM {state_table} WHERE dirty"
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return 0
+
+        prefixes = set()
+        for _, state_geohash, _ in rows:
+            prefixes |= cell_prefixes(state_geohash)
+        recompute_cells(prefixes)
+
+        # States that received another reading in the meantime stay dirty for the next run.
+        cursor.execute(
+            f"""
+            UPDATE {state_table} s SET dirty = false
+            FROM unnest(%s::bigint[], %s::bigint[]) AS seen(segment_id, reading_count)
+            WHERE s.segment_id = seen.segment_id AND s.reading_count = seen.reading_count
+            """,
+            [[row[0] for row in rows], [row[2] for row in rows]],
+        )
+    return len(rows)
+
+
+def rebuild():
+    """
+    Recomputes every latest state and cell with set-based SQL.
+    Used after bulk imports, which do not send the signals that keep them up to date.
+    """
+    state_table = SegmentLatestState._meta.db_table
+    cell_table = HeatmapCell._meta.db_table
+    segment_table = RoadSegment._meta.db_table
+    reading_table = TrafficReading._meta.db_table
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {cell_table}")
+        cursor.execute(f"DELETE FROM {state_table}")
+        cursor.execute(
+            f"""
+            INSERT INTO {state_table}
+                (segment_id, geohash, speed, timestamp, reading_count, speed_sum, dirty)
+            SELECT s.id, ST_GeoHash(ST_Centroid(s.geometry), 12),
+                   latest.speed_measured, latest.timestamp, COALESCE(counts.total, 0),
+                   COALESCE(counts.speed_sum, 0), false
+            FROM {segment_table} s
+            LEFT JOIN LATERAL (
+                SELECT r.speed_measured, r.timestamp FROM {reading_table} r
+                WHERE r.segment_id = s.id
+                ORDER BY r.timestamp DESC, r.id DESC LIMIT 1
+            ) latest ON true
+            LEFT JOIN (
+                SELECT segment_id, COUNT(*) AS total, SUM(speed_measured) AS speed_sum
+                FROM {reading_table} GROUP BY segment_id
+            ) counts ON counts.segment_id = s.id
+            """
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {cell_table}
+                (geohash, precision, segment_count, reporting_count, speed_sum, reading_count)
+            SELECT LEFT(st.geohash, p.precision), p.precision, COUNT(*), COUNT(st.speed),
+                   COALESCE(SUM(st.speed), 0), SUM(st.reading_count)
+            FROM {state_table} st CROSS JOIN unnest(%s::int[]) AS p(precision)
+            GROUP BY p.precision, LEFT(st.geohash, p.precision)
+            """,
+            [list(PRECISIONS)],
+        )
+
+
+def cells_in_bbox(west, south, east, north, zoom):
+    """
+    Returns the precision and the cells overlapping a viewport. The cost only
+    depends on the number of cells in view, not on the segments or readings.
+    """
+    precision = precision_for_zoom(zoom)
+    hashes = geohash.cover(west, south, east, north, precision, MAX_CELLS)
+    return precision, HeatmapCell.objects.filter(geohash__in=hashes)
@@ -0,0 +1,119 @@
+import asyncio
+import statistics
+import threading
+import time
+from unittest import mock
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.db.backends.utils import CursorWrapper
+from django.test import override_settings
+from rest_framework.settings import api_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares how the sync viewsets and the async views of one ASGI worker "
+        "cope with many concurrent slow connections."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--connections",
+            type=int,
+            help="Number of concurrent connections.",
+            default=200,
+        )
+        parser.add_argument(
+            "--client-delay",
+            type=float,
+            help="Seconds a slow client takes to consume every response message.",
+            default=0.05,
+        )
+        parser.add_argument(
+            "--query-delay",
+            type=float,
+            help="Seconds added to every database query, to simulate a slow database.",
+            default=0.0,
+        )
+
+    def handle(self, *args, **options):
+        application = get_asgi_application()
+        endpoints = {
+            'sync': '/api/roadsegments/',
+            'async': '/api/async/roadsegments/',
+        }
+
+        original_execute = CursorWrapper.execute
+
+        def slow_execute(cursor, *args, **kwargs):
+            time.sleep(options['query_delay'])
+            return original_execute(cursor, *args, **kwargs)
+
+        # The benchmark measures the views, so throttling and load shedding are disabled.
+        with override_settings(CONCURRENCY_LIMITS={}), \
+                mock.patch.dict(api_settings.DEFAULT_THROTTLE_RATES, clear=True), \
+                mock.patch.object(CursorWrapper, 'execute', slow_execute):
+            self.stdout.write(
+                f"{'views':<6} {'ok':>6} {'failed':>7} {'req/s':>8} "
+                f"{'p50 ms':>8} {'p99 ms':>8} {'threads':>8}"
+            )
+            for name, path in endpoints.items():
+                result = asyncio.run(self.run_load(
+                    application, path, options['connections'], options['client_delay']
+                ))
+                self.stdout.write(
+                    f"{name:<6} {result['ok']:>6} {result['failed']:>7} {result['rps']:>8.1f} "
+                    f"{result['p50']:>8.1f} {result['p99']:>8.1f} {result['threads']:>8}"
+                )
+
+    async def run_load(self, application, path, connections, client_delay):
+        peak_threads = threading.active_count()
+
+        async def request():
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': path,
+                'raw_path': path.encode(),
+                'query_string': b'',
+                'headers': [(b'host', b'localhost')],
+                'client': ('127.0.0.1', 50000),
+                'server': ('localhost', 8000),
+            }
+            status = None
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                nonlocal status, peak_threads
+                if message['type'] == 'http.response.start':
+                    status = message['status']
+                peak_threads = max(peak_threads, threading.active_count())
+                await asyncio.sleep(client_delay)
+
+            start = time.perf_counter()
+            await application(scope, receive, send)
+            return status, time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(request() for _ in range(connections)))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(duration * 1000 for status, duration in results if status == 200)
+        ok = len(latencies)
+        if ok > 1:
+            quantiles = statistics.quantiles(latencies, n=100)
+        else:
+            quantiles = [latencies[0] if latencies else 0.0] * 99
+        return {
+            'ok': ok,
+            'failed': connections - ok,
+            'rps': ok / elapsed,
+            'p50': quantiles[49],
+            'p99': quantiles[98],
+            'threads': peak_threads,
+        }
@@ -0,0 +1,68 @@
+import timeit
+from django.core.management.base import BaseCommand
+from django.contrib.gis.geos import LineString
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from traffic_data_app.models import RoadSegment
+from traffic_data_app.renderers import MessagePackRenderer, ORJSONRenderer
+from traffic_data_app.serializers import RoadSegmentSerializer
+
+
+class Command(BaseCommand):
+    help = "Measures the serialization and rendering time of road segments per 1,000 rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            help="Number of in-memory road segments to serialize.",
+            default=1000,
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            help="Number of timed runs; the best one is reported.",
+            default=5,
+        )
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        repeat = options['repeat']
+
+        # Unsaved instances, so the benchmark does not depend on the database.
+        segments = [
+            RoadSegment(
+                id=index,
+                name=f"Segment {index}",
+                geometry=LineString((index, 0), (index + 1, 1)),
+                length=100.0,
+            )
+            for index in range(rows)
+        ]
+
+        factory = APIRequestFactory()
+        renderers = {
+            'json': JSONRenderer(),
+            'orjson': ORJSONRenderer(),
+            'msgpack': MessagePackRenderer(),
+        }
+
+        self.stdout.write(f"{'fields':<10} {'step':<10} {'ms/1000 rows':>14}")
+        for label, query in (('all', ''), ('id,name', '?fields=id,name')):
+            request = Request(factory.get(f'/api/roadsegments/{query}'))
+
+            def serialize():
+                return RoadSegmentSerializer(
+                    segments, many=True, context={'request': request}
+                ).data
+
+            self.report(label, 'serialize', serialize, rows, repeat)
+
+            data = serialize()
+            for name, renderer in renderers.items():
+                self.report(label, name, lambda: renderer.render(data), rows, repeat)
+
+    def report(self, label, step, function, rows, repeat):
+        best = min(timeit.repeat(function, number=1, repeat=repeat))
+        self.stdout.write(f"{label:<10} {step:<10} {best * 1000 * 1000 / rows:>14.2f}")
@@ -0,0 +1,83 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a worker does before it can answer its first request.
+STARTUP_CODE = "from traffic_api.wsgi import application; import traffic_api.urls"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the cold start of a worker in fresh interpreters and lists "
+        "the slowest imports. Fails if the median exceeds --max-seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--runs",
+            type=int,
+            help="Number of fresh interpreters to start.",
+            default=5,
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            help="Number of slowest top-level imports to list.",
+            default=15,
+        )
+        parser.add_argument(
+            "--max-seconds",
+            type=float,
+            help="Fail when the median startup time is above this value.",
+            default=None,
+        )
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError('--runs must be at least 1.')
+
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE}
+        durations = []
+        for _ in range(options['runs']):
+            start = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", STARTUP_CODE],
+                cwd=settings.BASE_DIR,
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+            durations.append(time.perf_counter() - start)
+            if result.returncode:
+                raise CommandError(f"Startup failed:\n{result.stderr}")
+
+        self.stdout.write("Slowest top-level imports (cumulative, last run):")
+        for module, cumulative in self.top_imports(result.stderr, options['top']):
+            self.stdout.write(f"  {cumulative / 1000:>8.1f} ms  {module}")
+
+        median = statistics.median(durations)
+        self.stdout.write(
+            f"Startup: median {median:.3f}s, min {min(durations):.3f}s, max {max(durations):.3f}s "
+            f"over {len(durations)} runs"
+        )
+        if options['max_seconds'] is not None and median > options['max_seconds']:
+            raise CommandError(
+                f"Median startup time {median:.3f}s is above the limit of {options['max_seconds']:.3f}s."
+            )
+
+    def top_imports(self, importtime_output, count):
+        """Parses the output of -X importtime and returns the slowest top-level modules."""
+        imports = []
+        for line in importtime_output.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, module = line[len("import time:"):].split("|")
+            # Nested imports are indented under the module that imported them.
+            if module.startswith("  "):
+                continue
+            imports.append((module.strip(), int(cumulative)))
+        return sorted(imports, key=lambda item: item[1], reverse=True)[:count]
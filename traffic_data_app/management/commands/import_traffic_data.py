@@ -1,10 +1,194 @@
 import csv
+import glob
+import io
 import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
 from django.utils import timezone
-from traffic_data_app.models import RoadSegment, TrafficReading
+from traffic_data_app import heatmap, routing
+from traffic_data_app.models import HeatmapCell, RoadSegment, SegmentLatestState, TrafficReading
 from django.contrib.gis.geos import LineString, Point
 
+# Columns of the CSV that the importer understands.
+CSV_COLUMNS = ("ID", "Long_start", "Lat_start", "Long_end", "Lat_end", "Length", "Speed")
+
+# Shards smaller than this are not worth the overhead of a separate task.
+MIN_SHARD_SIZE = 1024 * 1024
+
+# Readings sent to the database by one COPY.
+COPY_BATCH_ROWS = 100_000
+
+
+def read_header(path):
+    """Returns the position of every column in CSV_COLUMNS for the given file."""
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        header = next(csv.reader(file), None)
+    if header is None:
+        raise CommandError(f'File "{path}" is empty.')
+
+    missing = [column for column in CSV_COLUMNS if column not in header]
+    if missing:
+        raise CommandError(f'File "{path}" is missing columns: {", ".join(missing)}.')
+    return {column: header.index(column) for column in CSV_COLUMNS}
+
+
+def plan_shards(paths, workers):
+    """
+    Splits the input files into byte ranges so that every worker gets
+    several shards of roughly the same size.
+    Returns a list of (path, start, end) tuples.
+    """
+    sizes = {path: os.path.getsize(path) for path in paths}
+    total_size = sum(sizes.values())
+    shard_size = max(total_size // (workers * 4), MIN_SHARD_SIZE)
+
+    shards = []
+    for path in paths:
+        size = sizes[path]
+        start = 0
+        while start < size:
+            end = min(start + shard_size, size)
+            shards.append((path, start, end))
+            start = end
+    return shards
+
+
+def iter_shard_rows(path, start, end):
+    """
+    Yields the parsed rows whose first byte falls inside [start, end).
+    The header line is skipped, and a row crossing the end of the shard
+    belongs to the shard where it starts.
+    """
+    with open(path, "rb") as file:
+        if start == 0:
+            file.readline()
+        else:
+            # Skip the partial row, which belongs to the previous shard.
+            file.seek(start - 1)
+            file.readline()
+
+        while file.tell() < end:
+            line = file.readline()
+            if not line:
+                break
+            line = line.rstrip(b"\r\n")
+            if line:
+                yield line.decode("utf-8").split(",")
+
+
+def scan_segments(shard, columns):
+    """Returns the first occurrence of every segment in the shard, keyed by CSV ID."""
+    id_col = columns["ID"]
+    segments = {}
+    for row in iter_shard_rows(*shard):
+        csv_id = int(row[id_col])
+        if csv_id not in segments:
+            segments[csv_id] = (
+                float(row[columns["Long_start"]]),
+                float(row[columns["Lat_start"]]),
+                float(row[columns["Long_end"]]),
+                float(row[columns["Lat_end"]]),
+                float(row[columns["Length"]]),
+            )
+    return segments
+
+
+def load_readings(shard, columns):
+    """
+    Streams the readings of one shard into the database with COPY,
+    on the worker's own connection, in batches of COPY_BATCH_ROWS rows
+    so that memory use does not grow with the size of the shard.
+    Returns the number of rows loaded.
+    """
+    id_col = columns["ID"]
+    speed_col = columns["Speed"]
+    csv_id_to_db_id = _worker_state["csv_id_to_db_id"]
+    timestamp = _worker_state["timestamp"]
+    table = TrafficReading._meta.db_table
+
+    rows = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        def copy(buffer):
+            buffer.seek(0)
+            cursor.cursor.copy_expert(
+                f"COPY {table} (uuid, segment_id, timestamp, speed_measured) "
+                "FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+
+        buffer = io.StringIO()
+        for row in iter_shard_rows(*shard):
+            segment_id = csv_id_to_db_id[int(row[id_col])]
+            # The speed is passed through as text; PostgreSQL parses it during COPY.
+            buffer.write(f"{uuid.uuid4()},{segment_id},{timestamp},{row[speed_col]}\n")
+            rows += 1
+            if rows % COPY_BATCH_ROWS == 0:
+                copy(buffer)
+                buffer = io.StringIO()
+
+        if rows % COPY_BATCH_ROWS:
+            copy(buffer)
+    return rows
+
+
+def delete_segments(segment_ids):
+    """
+    Deletes the given road segments and every row that references them with
+    one statement per table, and takes them out of the heatmap cells.
+    Used to remove what a failed import created, without the per-row
+    signals of a cascading delete and without touching other segments.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        prefixes = set()
+        states = SegmentLatestState.objects.filter(segment_id__in=segment_ids)
+        for state_geohash in states.values_list("geohash", flat=True).iterator():
+            prefixes |= heatmap.cell_prefixes(state_geohash)
+
+        for relation in RoadSegment._meta.related_objects:
+            cursor.execute(
+                f"DELETE FROM {relation.related_model._meta.db_table} "
+                f"WHERE {relation.field.column} = ANY(%s)",
+                [segment_ids],
+            )
+        cursor.execute(
+            f"DELETE FROM {RoadSegment._meta.db_table} WHERE id = ANY(%s)", [segment_ids]
+        )
+        heatmap.recompute_cells(prefixes)
+        routing.network_changed()
+
+
+def discard_import():
+    """
+    Deletes every road segment, with everything that references them, and
+    the heatmap cells, e.g. after an import was killed before it could
+    clean up. This also removes segments that were not imported.
+    """
+    segment_table = RoadSegment._meta.db_table
+    cell_table = HeatmapCell._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        # CASCADE also empties the readings, latest states, coverage and gaps.
+        cursor.execute(f"TRUNCATE {segment_table}, {cell_table} CASCADE")
+        routing.network_changed()
+
+
+# Data shared by every task of a loading worker, set once by init_worker.
+_worker_state = {}
+
+
+def init_worker(csv_id_to_db_id=None, timestamp=None):
+    """
+    Gives every worker process its own database connection and the
+    segment mapping, so it is not sent again with every shard.
+    """
+    import django
+
+    django.setup()
+    connections.close_all()
+    _worker_state["csv_id_to_db_id"] = csv_id_to_db_id
+    _worker_state["timestamp"] = timestamp.isoformat() if timestamp else None
+
 
 class Command(BaseCommand):
     help = "Imports road segment and traffic reading data from a CSV file."
@@ -13,16 +197,58 @@ class Command(BaseCommand):
         parser.add_argument(
             "--traffic_speed_path",
             type=str,
-            help="Path to the traffic_speed.csv file.",
+            help="Path to the traffic_speed.csv file. Accepts a glob when --workers is used.",
             default="traffic_data_app/data/traffic_speed.csv",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Number of worker processes used to parse and load the readings.",
+            default=1,
+        )
+        parser.add_argument(
+            "--discard",
+            action="store_true",
+            help="Delete every road segment and reading, e.g. left by an interrupted import, and exit.",
+        )
+        parser.add_argument(
+            "--noinput",
+            "--no-input",
+            action="store_false",
+            dest="interactive",
+            help="Do not ask for confirmation before --discard deletes the network.",
+        )
 
     def handle(self, *args, **options):
+        if options['discard']:
+            if options['interactive']:
+                confirm = input(
+                    "This will delete every road segment, with its readings, latest state, "
+                    "coverage and gaps, including segments that were not imported.\n"
+                    "Are you sure you want to do this?\n\n"
+                    "    Type 'yes' to continue, or 'no' to cancel: "
+                )
+                if confirm != 'yes':
+                    self.stdout.write('Discard cancelled.')
+                    return
+            discard_import()
+            self.stdout.write(self.style.SUCCESS('Deleted every road segment and reading.'))
+            return
+
         if RoadSegment.objects.exists():
             self.stdout.write(self.style.WARNING('Database already contains road segments. Seeding will be skipped.'))
             return
 
         self.stdout.write(self.style.NOTICE('Starting data import...'))
+        # Ids of the segments this import created, deleted again if it fails.
+        self.created_segment_ids = []
+
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1.')
+
+        if options['workers'] > 1:
+            self.handle_parallel(options['traffic_speed_path'], options['workers'])
+            return
 
         csv_path = options['traffic_speed_path']
         if not os.path.exists(csv_path):
@@ -51,6 +277,7 @@ class Command(BaseCommand):
 
                         segments_to_create[csv_id] = RoadSegment(
                             name=f"Segment {csv_id}",
+                            external_id=str(csv_id),
                             geometry=line_string,
                             length=float(row['Length']),
                         )
@@ -62,6 +289,7 @@ class Command(BaseCommand):
                 created_segments = RoadSegment.objects.bulk_create(
                     list(segments_to_create.values())
                 )
+                self.created_segment_ids = [seg.id for seg in created_segments]
                 self.stdout.write(self.style.SUCCESS(f'Created {len(created_segments)} unique road segments.'))
                 
                 # Step 3: Create a map from the original CSV ID to the new database ID.
@@ -81,8 +309,95 @@ class Command(BaseCommand):
 
                 TrafficReading.objects.bulk_create(traffic_readings_to_create)
                 self.stdout.write(self.style.SUCCESS(f'Created {len(traffic_readings_to_create)} traffic readings.'))
+
+                # Bulk creation sends no signals, so the heatmap is rebuilt in one pass.
+                heatmap.rebuild()
+                self.stdout.write(self.style.SUCCESS('Rebuilt the heatmap cells.'))
+                # Bulk creation sends no signals either, so the routing graphs are marked out of date here.
+                routing.network_changed()
                 
                 self.stdout.write(self.style.SUCCESS('Data import completed successfully!'))
 
         except Exception as e:
-            raise CommandError(f'An error occurred during import: {e}')
\ No newline at end of file
+            self.discard_failed_import()
+            raise CommandError(f'An error occurred during import: {e}')
+
+    def discard_failed_import(self):
+        """Deletes what a failed import created, so that it can simply be run again."""
+        if not self.created_segment_ids:
+            return
+        connections.close_all()
+        delete_segments(self.created_segment_ids)
+        self.stderr.write('The segments and readings of the failed import were deleted.')
+
+    def handle_parallel(self, path_pattern, workers):
+        """
+        Imports the data with a pool of worker processes.
+        The input is split into byte-range shards. The segments are resolved
+        once up front, then every worker loads the readings of its shards with COPY.
+        """
+        paths = sorted(glob.glob(path_pattern))
+        if not paths:
+            raise CommandError(f'File "{path_pattern}" not found.')
+
+        columns_by_path = {path: read_header(path) for path in paths}
+        shards = plan_shards(paths, workers)
+        self.stdout.write(self.style.NOTICE(
+            f'Importing {len(paths)} file(s) in {len(shards)} shard(s) with {workers} workers...'
+        ))
+
+        # Workers must not inherit the parent's open connection.
+        connections.close_all()
+
+        try:
+            # Step 1: Resolve the segment dimension across all shards.
+            segments = {}
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+                shard_segments = pool.map(
+                    scan_segments, shards, [columns_by_path[path] for path, _, _ in shards]
+                )
+                for found in shard_segments:
+                    for csv_id, values in found.items():
+                        segments.setdefault(csv_id, values)
+
+            created_segments = RoadSegment.objects.bulk_create([
+                RoadSegment(
+                    name=f"Segment {csv_id}",
+                    external_id=str(csv_id),
+                    geometry=LineString(
+                        Point(long_start, lat_start), Point(long_end, lat_end)
+                    ),
+                    length=length,
+                )
+                for csv_id, (long_start, lat_start, long_end, lat_end, length) in segments.items()
+            ])
+            self.created_segment_ids = [seg.id for seg in created_segments]
+            self.stdout.write(self.style.SUCCESS(f'Created {len(created_segments)} unique road segments.'))
+
+            csv_id_to_db_id = {
+                csv_id: seg.id for csv_id, seg in zip(segments, created_segments)
+            }
+            connections.close_all()
+
+            # Step 2: Load the readings of every shard in parallel.
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=init_worker,
+                initargs=(csv_id_to_db_id, timezone.now()),
+            ) as pool:
+                total = sum(pool.map(
+                    load_readings, shards, [columns_by_path[path] for path, _, _ in shards]
+                ))
+
+            self.stdout.write(self.style.SUCCESS(f'Created {total} traffic readings.'))
+
+            heatmap.rebuild()
+            self.stdout.write(self.style.SUCCESS('Rebuilt the heatmap cells.'))
+            routing.network_changed()
+            self.stdout.write(self.style.SUCCESS('Data import completed successfully!'))
+
+        except Exception as e:
+            self.discard_failed_import()
+            if isinstance(e, CommandError):
+                raise
+            raise CommandError(f'An error occurred during import: {e}')
@@ -0,0 +1,431 @@
+import asyncio
+import contextvars
+import io
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.settings import api_settings
+from traffic_data_app.models import RoadSegment
+
+WRITE_ENDPOINT = "POST /api/trafficreadings/"
+
+# Filters sent by the readers, in turn picked at random.
+READ_QUERIES = (
+    "",
+    "last_reading_characterization=high_speed",
+    "last_reading_characterization=medium_speed",
+    "last_reading_characterization=low_speed",
+)
+
+# Lock waits are only a regression when they also grow by at least this many seconds.
+MIN_LOCK_WAIT_REGRESSION = 0.5
+
+# Endpoint of the request being served, used to tag its database session.
+current_endpoint = contextvars.ContextVar("current_endpoint", default=None)
+
+
+def tag_session(sender, connection, **kwargs):
+    """Names the database sessions opened by the load test after their endpoint."""
+    endpoint = current_endpoint.get()
+    if endpoint is not None:
+        with connection.cursor() as cursor:
+            cursor.execute("SET application_name = %s", [f"load_test:{endpoint}"[:63]])
+
+
+def summarize(samples, elapsed, lock_waits):
+    """
+    Returns the throughput, latency percentiles (ms) and lock waits of an
+    endpoint from its (status, seconds) samples.
+    """
+    latencies = sorted(duration * 1000 for status, duration in samples if 200 <= status < 300)
+    ok = len(latencies)
+    if ok > 1:
+        quantiles = statistics.quantiles(latencies, n=100)
+    else:
+        quantiles = [latencies[0] if latencies else 0.0] * 99
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - ok,
+        "throughput": ok / elapsed if elapsed else 0.0,
+        "p50": quantiles[49],
+        "p95": quantiles[94],
+        "p99": quantiles[98],
+        "lock_wait_seconds": lock_waits.get("seconds", 0.0),
+        "max_waiting": lock_waits.get("max_waiting", 0),
+    }
+
+
+def find_regressions(baseline, results, tolerance):
+    """Returns a description of every metric of `results` worse than `baseline` by more than `tolerance`."""
+    regressions = []
+    for endpoint, before in baseline["endpoints"].items():
+        after = results["endpoints"].get(endpoint)
+        if after is None:
+            regressions.append(f"{endpoint}: missing from the results")
+            continue
+        if after["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{endpoint}: throughput {after['throughput']:.1f} req/s "
+                f"(baseline {before['throughput']:.1f})"
+            )
+        for percentile in ("p95", "p99"):
+            if after[percentile] > before[percentile] * (1 + tolerance):
+                regressions.append(
+                    f"{endpoint}: {percentile} {after[percentile]:.1f} ms "
+                    f"(baseline {before[percentile]:.1f})"
+                )
+        lock_wait, lock_wait_before = after["lock_wait_seconds"], before["lock_wait_seconds"]
+        if (lock_wait > lock_wait_before * (1 + tolerance)
+                and lock_wait - lock_wait_before >= MIN_LOCK_WAIT_REGRESSION):
+            regressions.append(
+                f"{endpoint}: lock waits {lock_wait:.2f}s (baseline {lock_wait_before:.2f}s)"
+            )
+    return regressions
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs concurrent writers posting readings and readers listing filtered "
+        "segments through the WSGI or ASGI application, and reports throughput, "
+        "latency percentiles and database lock waits per endpoint. The readings "
+        "are written to the configured database, so point it at a disposable one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--writers",
+            type=int,
+            help="Number of concurrent clients posting readings.",
+            default=8,
+        )
+        parser.add_argument(
+            "--readers",
+            type=int,
+            help="Number of concurrent clients listing road segments.",
+            default=16,
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            help="Seconds the load is applied for.",
+            default=30.0,
+        )
+        parser.add_argument(
+            "--server",
+            choices=("wsgi", "asgi"),
+            help="Application the requests are sent to.",
+            default="wsgi",
+        )
+        parser.add_argument(
+            "--read-path",
+            help="Path listed by the readers, e.g. /api/async/roadsegments/.",
+            default="/api/roadsegments/",
+        )
+        parser.add_argument(
+            "--segments",
+            type=int,
+            help="Number of segments (lowest ids first) the writers post readings for.",
+            default=1000,
+        )
+        parser.add_argument(
+            "--username",
+            help="Superuser whose token authenticates the writers.",
+            default="admin",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            help="Seed of the random segments, speeds and filters.",
+            default=0,
+        )
+        parser.add_argument(
+            "--sample-interval",
+            type=float,
+            help="Seconds between two samples of the waiting database sessions.",
+            default=0.1,
+        )
+        parser.add_argument(
+            "--save",
+            help="Write the results as a JSON baseline to this file.",
+            default=None,
+        )
+        parser.add_argument(
+            "--compare",
+            help="Fail if the results are worse than the JSON baseline in this file.",
+            default=None,
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            help="Relative degradation allowed by --compare.",
+            default=0.2,
+        )
+
+    def handle(self, *args, **options):
+        if options['writers'] < 0 or options['readers'] < 0 or not options['writers'] + options['readers']:
+            raise CommandError('At least one writer or reader is needed.')
+        if options['duration'] <= 0:
+            raise CommandError('--duration must be positive.')
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+
+        self.segment_ids = list(
+            RoadSegment.objects.order_by('id').values_list('id', flat=True)[:options['segments']]
+        )
+        if not self.segment_ids:
+            raise CommandError('There are no road segments; import some data first.')
+        try:
+            user = User.objects.get(username=options['username'], is_superuser=True)
+        except User.DoesNotExist:
+            raise CommandError(f"There is no superuser named {options['username']}.")
+        self.token = Token.objects.get_or_create(user=user)[0].key
+        self.read_endpoint = f"GET {options['read_path']}"
+
+        config = {
+            key: options[key]
+            for key in ('server', 'writers', 'readers', 'duration', 'read_path', 'segments', 'seed')
+        }
+        self.stdout.write(
+            f"Running {options['writers']} writers and {options['readers']} readers against "
+            f"the {options['server'].upper()} application for {options['duration']:g}s..."
+        )
+
+        deadlocks = self.deadlocks()
+        # The load test measures the application and the database, so throttling
+        # and load shedding are disabled.
+        connection_created.connect(tag_session)
+        try:
+            with override_settings(CONCURRENCY_LIMITS={}), \
+                    mock.patch.dict(api_settings.DEFAULT_THROTTLE_RATES, clear=True):
+                samples, lock_waits, elapsed = self.run_load(options)
+        finally:
+            connection_created.disconnect(tag_session)
+            connections.close_all()
+
+        results = {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "config": config,
+            "endpoints": {
+                endpoint: summarize(endpoint_samples, elapsed, lock_waits.get(endpoint, {}))
+                for endpoint, endpoint_samples in samples.items()
+            },
+            "deadlocks": self.deadlocks() - deadlocks,
+        }
+        self.report(results)
+
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(f"Results saved to {options['save']}.")
+
+        if baseline is not None:
+            if baseline.get("config") != config:
+                self.stderr.write(
+                    f"The baseline was recorded with a different configuration: {baseline.get('config')}"
+                )
+            regressions = find_regressions(baseline, results, options['tolerance'])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regression against the baseline."))
+
+    def run_load(self, options):
+        """Applies the load and returns the samples and lock waits per endpoint, and the elapsed time."""
+        samples = {}
+        if options['writers']:
+            samples[WRITE_ENDPOINT] = []
+        if options['readers']:
+            samples[self.read_endpoint] = []
+        clients = (
+            [(WRITE_ENDPOINT, index) for index in range(options['writers'])]
+            + [(self.read_endpoint, options['writers'] + index) for index in range(options['readers'])]
+        )
+
+        stop = threading.Event()
+        lock_waits = {}
+        monitor = threading.Thread(
+            target=self.monitor_locks, args=(stop, options['sample_interval'], lock_waits)
+        )
+        monitor.start()
+
+        start = time.perf_counter()
+        deadline = start + options['duration']
+        try:
+            if options['server'] == 'wsgi':
+                application = get_wsgi_application()
+                threads = [
+                    threading.Thread(
+                        target=self.run_wsgi_client,
+                        args=(application, endpoint, random.Random(options['seed'] + index),
+                              deadline, samples[endpoint]),
+                    )
+                    for endpoint, index in clients
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            else:
+                application = get_asgi_application()
+
+                async def run_clients():
+                    await asyncio.gather(*(
+                        self.run_asgi_client(
+                            application, endpoint, random.Random(options['seed'] + index),
+                            deadline, samples[endpoint],
+                        )
+                        for endpoint, index in clients
+                    ))
+
+                asyncio.run(run_clients())
+        finally:
+            elapsed = time.perf_counter() - start
+            stop.set()
+            monitor.join()
+        return samples, lock_waits, elapsed
+
+    def next_request(self, endpoint, rng):
+        """Returns the (method, path, query string, body, headers) of the next request of a client."""
+        headers = [("host", "localhost")]
+        if endpoint == WRITE_ENDPOINT:
+            body = json.dumps({
+                "segment": rng.choice(self.segment_ids),
+                "speed_measured": round(rng.uniform(5, 120), 1),
+            }).encode()
+            headers += [
+                ("content-type", "application/json"),
+                ("content-length", str(len(body))),
+                ("authorization", f"Token {self.token}"),
+            ]
+            return "POST", "/api/trafficreadings/", "", body, headers
+        return "GET", self.read_endpoint.split(" ", 1)[1], rng.choice(READ_QUERIES), b"", headers
+
+    def run_wsgi_client(self, application, endpoint, rng, deadline, samples):
+        current_endpoint.set(endpoint)
+        try:
+            while time.perf_counter() < deadline:
+                method, path, query, body, headers = self.next_request(endpoint, rng)
+                environ = {
+                    "REQUEST_METHOD": method,
+                    "PATH_INFO": path,
+                    "QUERY_STRING": query,
+                    "SERVER_NAME": "localhost",
+                    "SERVER_PORT": "8000",
+                    "SERVER_PROTOCOL": "HTTP/1.1",
+                    "REMOTE_ADDR": "127.0.0.1",
+                    "wsgi.input": io.BytesIO(body),
+                    "wsgi.errors": sys.stderr,
+                    "wsgi.url_scheme": "http",
+                    "wsgi.version": (1, 0),
+                    "wsgi.multithread": True,
+                    "wsgi.multiprocess": False,
+                    "wsgi.run_once": False,
+                }
+                for name, value in headers:
+                    key = name.upper().replace("-", "_")
+                    environ[key if key in ("CONTENT_TYPE", "CONTENT_LENGTH") else f"HTTP_{key}"] = value
+                status = []
+
+                def start_response(status_line, response_headers, exc_info=None):
+                    status.append(int(status_line.split(" ", 1)[0]))
+
+                start = time.perf_counter()
+                response = application(environ, start_response)
+                try:
+                    for _ in response:
+                        pass
+                finally:
+                    # Closing the response ends the request, as a WSGI server would.
+                    response.close()
+                samples.append((status[0], time.perf_counter() - start))
+        finally:
+            connections.close_all()
+
+    async def run_asgi_client(self, application, endpoint, rng, deadline, samples):
+        current_endpoint.set(endpoint)
+        while time.perf_counter() < deadline:
+            method, path, query, body, headers = self.next_request(endpoint, rng)
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': method,
+                'scheme': 'http',
+                'path': path,
+                'raw_path': path.encode(),
+                'query_string': query.encode(),
+                'headers': [(name.encode(), value.encode()) for name, value in headers],
+                'client': ('127.0.0.1', 50000),
+                'server': ('localhost', 8000),
+            }
+            status = None
+
+            async def receive():
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+
+            async def send(message):
+                nonlocal status
+                if message['type'] == 'http.response.start':
+                    status = message['status']
+
+            start = time.perf_counter()
+            await application(scope, receive, send)
+            samples.append((status, time.perf_counter() - start))
+
+    def monitor_locks(self, stop, interval, lock_waits):
+        """
+        Samples the sessions of the load test waiting on a lock until `stop` is
+        set. The waiting time of an endpoint is estimated as the number of its
+        waiting sessions times the sampling interval.
+        """
+        try:
+            with connection.cursor() as cursor:
+                while not stop.wait(interval):
+                    cursor.execute(
+                        """
+                        SELECT substr(application_name, 11), COUNT(*) FROM pg_stat_activity
+                        WHERE datname = current_database() AND wait_event_type = 'Lock'
+                          AND application_name LIKE %s
+                        GROUP BY application_name
+                        """,
+                        ["load\\_test:%"],
+                    )
+                    for endpoint, waiting in cursor.fetchall():
+                        waits = lock_waits.setdefault(endpoint, {"seconds": 0.0, "max_waiting": 0})
+                        waits["seconds"] += waiting * interval
+                        waits["max_waiting"] = max(waits["max_waiting"], waiting)
+        finally:
+            connection.close()
+
+    def deadlocks(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()")
+            return cursor.fetchone()[0]
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'endpoint':<40} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} "
+            f"{'p95 ms':>8} {'p99 ms':>8} {'lock wait s':>12}"
+        )
+        for endpoint, result in results["endpoints"].items():
+            self.stdout.write(
+                f"{endpoint:<40} {result['requests']:>9} {result['errors']:>7} "
+                f"{result['throughput']:>8.1f} {result['p50']:>8.1f} {result['p95']:>8.1f} "
+                f"{result['p99']:>8.1f} {result['lock_wait_seconds']:>12.2f}"
+            )
+        self.stdout.write(f"Deadlocks: {results['deadlocks']}")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from traffic_data_app import heatmap
+
+
+class Command(BaseCommand):
+    help = "Recomputes the latest state of every segment and the heatmap cells from the readings."
+
+    def handle(self, *args, **options):
+        heatmap.rebuild()
+        self.stdout.write(self.style.SUCCESS('Heatmap rebuilt successfully!'))
@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from traffic_data_app import coverage
+
+
+class Command(BaseCommand):
+    help = (
+        "Applies the readings created since the last run to the segment coverage "
+        "and sensor gap tables. Meant to be run on a schedule, e.g. every minute, "
+        "or to keep running with --interval."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Number of readings applied per statement (defaults to COVERAGE_BATCH_SIZE).",
+            default=None,
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Drop the coverage and gaps and apply every reading again.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Keep running and apply new readings every INTERVAL seconds.",
+            default=None,
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        interval = options['interval']
+        if interval is not None and interval <= 0:
+            raise CommandError('--interval must be positive.')
+        if interval is not None and options['rebuild']:
+            raise CommandError('--interval cannot be combined with --rebuild.')
+
+        if options['rebuild']:
+            applied = coverage.rebuild(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Applied {applied} readings to the coverage.'))
+            return
+
+        while True:
+            # Drops a connection the database closed since the last run.
+            close_old_connections()
+            applied = coverage.update(options['batch_size'])
+            if applied or interval is None:
+                self.stdout.write(self.style.SUCCESS(f'Applied {applied} readings to the coverage.'))
+            if interval is None:
+                return
+            time.sleep(interval)
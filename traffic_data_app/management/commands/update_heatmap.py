@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from traffic_data_app import heatmap
+
+
+class Command(BaseCommand):
+    help = (
+        "Folds the segments that received readings since the last run into "
+        "the heatmap cells. Meant to be run on a schedule, e.g. every minute, "
+        "or to keep running with --interval."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Keep running and update the cells every INTERVAL seconds.",
+            default=None,
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if interval is not None and interval <= 0:
+            raise CommandError('--interval must be positive.')
+
+        while True:
+            # Drops a connection the database closed since the last run.
+            close_old_connections()
+            folded = heatmap.update()
+            if folded or interval is None:
+                self.stdout.write(self.style.SUCCESS(f'Updated the heatmap cells of {folded} segments.'))
+            if interval is None:
+                return
+            time.sleep(interval)
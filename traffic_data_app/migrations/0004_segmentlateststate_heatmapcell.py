@@ -0,0 +1,53 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("traffic_data_app", "0003_create_initial_users"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HeatmapCell",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("geohash", models.CharField(max_length=12, unique=True)),
+                ("precision", models.PositiveSmallIntegerField()),
+                ("segment_count", models.IntegerField(default=0)),
+                ("reporting_count", models.IntegerField(default=0)),
+                ("speed_sum", models.FloatField(default=0)),
+                ("reading_count", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="SegmentLatestState",
+            fields=[
+                (
+                    "segment",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="latest_state",
+                        serialize=False,
+                        to="traffic_data_app.roadsegment",
+                    ),
+                ),
+                ("geohash", models.CharField(db_index=True, max_length=12)),
+                ("speed", models.FloatField(null=True)),
+                ("timestamp", models.DateTimeField(null=True)),
+                ("reading_count", models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("traffic_data_app", "0004_segmentlateststate_heatmapcell"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="roadsegment",
+            name="external_id",
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
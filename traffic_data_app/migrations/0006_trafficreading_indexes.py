@@ -0,0 +1,54 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:00
+
+import django.db.models.deletion
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The indexes are built without blocking writes to the readings, which
+    # cannot be done inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("traffic_data_app", "0005_roadsegment_external_id"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="trafficreading",
+            index=models.Index(
+                fields=["timestamp"], name="traffic_dat_timesta_023cb4_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="trafficreading",
+            index=models.Index(
+                fields=["segment", "-timestamp"], name="traffic_dat_segment_bb5252_idx"
+            ),
+        ),
+        # The (segment, -timestamp) index also serves every lookup by segment.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name="trafficreading",
+                    name="segment",
+                    field=models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="traffic_readings",
+                        to="traffic_data_app.roadsegment",
+                    ),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    "DROP INDEX CONCURRENTLY IF EXISTS traffic_data_app_trafficreading_segment_id_a6de9942",
+                    reverse_sql=(
+                        "CREATE INDEX CONCURRENTLY IF NOT EXISTS traffic_data_app_trafficreading_segment_id_a6de9942 "
+                        "ON traffic_data_app_trafficreading (segment_id)"
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.4 on 2026-10-19 13:00
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("traffic_data_app", "0006_trafficreading_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CoverageWatermark",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("last_reading_id", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="SegmentCoverage",
+            fields=[
+                (
+                    "segment",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="coverage",
+                        serialize=False,
+                        to="traffic_data_app.roadsegment",
+                    ),
+                ),
+                ("first_seen", models.DateTimeField()),
+                ("last_seen", models.DateTimeField(db_index=True)),
+                ("reading_count", models.BigIntegerField(default=0)),
+                ("gap_count", models.IntegerField(default=0)),
+                ("total_gap", models.DurationField(default=datetime.timedelta(0))),
+                ("longest_gap", models.DurationField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="SensorGap",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("started_at", models.DateTimeField()),
+                ("ended_at", models.DateTimeField()),
+                ("duration", models.DurationField()),
+                (
+                    "segment",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="gaps",
+                        to="traffic_data_app.roadsegment",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["segment", "-started_at"],
+                        name="traffic_dat_segment_f80d33_idx",
+                    )
+                ],
+            },
+        ),
+    ]
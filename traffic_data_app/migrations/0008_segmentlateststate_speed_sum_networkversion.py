@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-20 09:00
+
+from django.db import migrations, models
+
+
+def create_network_version(apps, schema_editor):
+    NetworkVersion = apps.get_model("traffic_data_app", "NetworkVersion")
+    NetworkVersion.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("traffic_data_app", "0007_coverage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="segmentlateststate",
+            name="speed_sum",
+            field=models.FloatField(default=0),
+        ),
+        migrations.CreateModel(
+            name="NetworkVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_network_version, migrations.RunPython.noop),
+    ]
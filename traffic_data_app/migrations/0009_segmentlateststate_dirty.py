@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-20 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("traffic_data_app", "0008_segmentlateststate_speed_sum_networkversion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="segmentlateststate",
+            name="dirty",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name="segmentlateststate",
+            index=models.Index(
+                condition=models.Q(("dirty", True)),
+                fields=["segment"],
+                name="segmentlateststate_dirty_idx",
+            ),
+        ),
+    ]
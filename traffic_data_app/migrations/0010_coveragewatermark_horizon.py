@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-20 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("traffic_data_app", "0009_segmentlateststate_dirty"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="coveragewatermark",
+            name="horizon_reading_id",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="coveragewatermark",
+            name="pending_reading_id",
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="coveragewatermark",
+            name="pending_xmax",
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="coveragewatermark",
+            name="pending_at",
+            field=models.DateTimeField(null=True),
+        ),
+    ]
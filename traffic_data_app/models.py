@@ -1,4 +1,5 @@
 import uuid
+from datetime import timedelta
 from django.db import models
 from django.contrib.gis.db import models as gis_models
 from django.contrib.gis.geos import LineString, Point
@@ -9,6 +10,8 @@ class RoadSegment(gis_models.Model):
     uuid = models.UUIDField(
         default=uuid.uuid4, unique=True, db_index=True, editable=False
     )
+    # Identifier of the segment in the source network data (e.g. the CSV ID).
+    external_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
 
     geometry = gis_models.LineStringField(srid=4326)
 
@@ -23,11 +26,137 @@ class TrafficReading(models.Model):
         default=uuid.uuid4, unique=True, db_index=True, editable=False
     )
 
+    # Indexed by the (segment, -timestamp) index below.
     segment = models.ForeignKey(
-        RoadSegment, on_delete=models.CASCADE, related_name="traffic_readings"
+        RoadSegment, on_delete=models.CASCADE, related_name="traffic_readings", db_index=False
     )
     timestamp = models.DateTimeField(auto_now_add=True)
     speed_measured = models.FloatField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["timestamp"]),
+            models.Index(fields=["segment", "-timestamp"]),
+        ]
+
     def __str__(self):
         return f"Speed for {self.segment.name} at {self.timestamp}: {self.speed_measured} km/h"
+
+
+class SegmentLatestState(models.Model):
+    """
+    Latest speed and reading volume of a RoadSegment, with the geohash of its
+    centroid. Kept up to date as readings arrive and folded into the heatmap
+    cells in batches.
+    """
+    segment = models.OneToOneField(
+        RoadSegment, on_delete=models.CASCADE, primary_key=True, related_name="latest_state"
+    )
+    geohash = models.CharField(max_length=12, db_index=True)
+    speed = models.FloatField(null=True)
+    timestamp = models.DateTimeField(null=True)
+    reading_count = models.BigIntegerField(default=0)
+    # Sum of the speeds of every reading, for the historical average speed.
+    speed_sum = models.FloatField(default=0)
+    # Set when a reading changed the state, until heatmap.update() folds it into the cells.
+    dirty = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["segment"],
+                condition=models.Q(dirty=True),
+                name="segmentlateststate_dirty_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Latest state of segment {self.segment_id}: {self.speed} km/h"
+
+
+class NetworkVersion(models.Model):
+    """
+    Incremented whenever the road network changes, so that every process
+    knows its routing graph is out of date. There is a single row.
+    """
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Road network version {self.version}"
+
+
+class HeatmapCell(models.Model):
+    """
+    Aggregated latest speeds and reading volume of the segments whose
+    centroid falls inside a geohash cell.
+    """
+    geohash = models.CharField(max_length=12, unique=True)
+    precision = models.PositiveSmallIntegerField()
+    segment_count = models.IntegerField(default=0)
+    reporting_count = models.IntegerField(default=0)
+    speed_sum = models.FloatField(default=0)
+    reading_count = models.BigIntegerField(default=0)
+
+    @property
+    def average_speed(self):
+        if not self.reporting_count:
+            return None
+        return self.speed_sum / self.reporting_count
+
+    def __str__(self):
+        return f"Heatmap cell {self.geohash}"
+
+
+class SegmentCoverage(models.Model):
+    """
+    When a RoadSegment was first and last seen reporting, and the gaps in
+    its readings. Maintained in batches by the update_coverage command.
+    """
+    segment = models.OneToOneField(
+        RoadSegment, on_delete=models.CASCADE, primary_key=True, related_name="coverage"
+    )
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField(db_index=True)
+    reading_count = models.BigIntegerField(default=0)
+    gap_count = models.IntegerField(default=0)
+    total_gap = models.DurationField(default=timedelta(0))
+    longest_gap = models.DurationField(null=True)
+
+    def __str__(self):
+        return f"Coverage of segment {self.segment_id}: last seen at {self.last_seen}"
+
+
+class SensorGap(models.Model):
+    """A period longer than SENSOR_GAP_THRESHOLD between two readings of a segment."""
+    segment = models.ForeignKey(
+        RoadSegment, on_delete=models.CASCADE, related_name="gaps"
+    )
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    duration = models.DurationField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["segment", "-started_at"]),
+        ]
+
+    def __str__(self):
+        return f"Gap of segment {self.segment_id} from {self.started_at} to {self.ended_at}"
+
+
+class CoverageWatermark(models.Model):
+    """
+    Id of the last reading applied to the coverage tables, and how far they may
+    go. Readings up to horizon_reading_id are committed for good. The pending
+    horizon becomes the horizon once every transaction that was in flight when
+    it was captured has ended. There is a single row.
+    """
+    last_reading_id = models.BigIntegerField(default=0)
+    horizon_reading_id = models.BigIntegerField(default=0)
+    pending_reading_id = models.BigIntegerField(null=True)
+    # pg_snapshot_xmax() of the snapshot the pending horizon was captured in
+    pending_xmax = models.BigIntegerField(null=True)
+    pending_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"Coverage up to reading {self.last_reading_id}"
@@ -0,0 +1,62 @@
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# Reuses DRF's handling of the types orjson and msgpack do not know about
+# (lazy translation strings, decimals, geometries, ...).
+_default = JSONEncoder().default
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    Renders JSON with orjson. Clients opt in with
+    'Accept: application/json; encoder=orjson'; a plain 'application/json'
+    or '*/*' is still served by the stock JSONRenderer.
+    """
+
+    media_type = "application/json; encoder=orjson"
+    format = "orjson"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return orjson.dumps(
+            data, default=_default, option=orjson.OPT_NON_STR_KEYS
+        )
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renders MessagePack. Clients opt in with
+    'Accept: application/msgpack' or '?format=msgpack'.
+    """
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+class PlainTextRenderer(BaseRenderer):
+    """
+    Renders text responses, such as the Prometheus metrics. Errors are
+    rendered as their detail message.
+    """
+
+    media_type = "text/plain"
+    format = "txt"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if isinstance(data, dict) and "detail" in data:
+            data = data["detail"]
+        return str(data).encode(self.charset)
@@ -0,0 +1,342 @@
+import heapq
+import math
+import threading
+import time
+from array import array
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+
+from .models import NetworkVersion, RoadSegment, SegmentLatestState, TrafficReading
+from .visibility import reading_snapshot
+
+# Speed (km/h) used for segments that have never been read.
+DEFAULT_SPEED = 50.0
+
+# Endpoints closer than this many decimal places of a degree are the same node.
+SNAP_PRECISION = 6
+
+# Size, in degrees, of the cells used to find the node nearest to a point.
+GRID_CELL_SIZE = 0.01
+
+# How many rings of cells are searched around a point before giving up.
+MAX_SNAP_RINGS = 50
+
+EARTH_RADIUS = 6371000.0
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    """Returns the distance in metres between two points."""
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+class RoadGraph:
+    """
+    Directed graph of the road network, stored in compressed sparse row
+    arrays. Every RoadSegment is an edge from its start to its end point,
+    weighted by its travel time in seconds.
+    """
+
+    def __init__(self, segments):
+        """
+        Builds the graph from an iterable of (id, geometry, length) tuples.
+        """
+        self.node_lon = array("d")
+        self.node_lat = array("d")
+        node_ids = {}
+
+        def node_for(lon, lat):
+            key = (round(lon, SNAP_PRECISION), round(lat, SNAP_PRECISION))
+            if key not in node_ids:
+                node_ids[key] = len(self.node_lon)
+                self.node_lon.append(lon)
+                self.node_lat.append(lat)
+            return node_ids[key]
+
+        edges = []
+        # Lowest ratio between the length of a segment and the straight-line
+        # distance between its ends, which keeps the A* heuristic admissible.
+        self.length_ratio = 1.0
+        for segment_id, geometry, length in segments:
+            start, end = geometry.coords[0], geometry.coords[-1]
+            edges.append((node_for(*start), node_for(*end), segment_id, length))
+            distance = haversine(*start, *end)
+            if distance > 0:
+                self.length_ratio = min(self.length_ratio, length / distance)
+
+        # Counting sort of the edges by source node.
+        node_count = len(self.node_lon)
+        self.offsets = array("q", [0] * (node_count + 1))
+        for source, _, _, _ in edges:
+            self.offsets[source + 1] += 1
+        for node in range(node_count):
+            self.offsets[node + 1] += self.offsets[node]
+
+        edge_count = len(edges)
+        self.edge_target = array("q", [0] * edge_count)
+        self.edge_segment = array("q", [0] * edge_count)
+        self.edge_length = array("d", [0.0] * edge_count)
+        self.edge_weight = array("d", [0.0] * edge_count)
+        self.edge_source = array("q", [0] * edge_count)
+        self.segment_edge = {}
+
+        position = array("q", self.offsets[:-1])
+        for source, target, segment_id, length in edges:
+            edge = position[source]
+            position[source] += 1
+            self.edge_source[edge] = source
+            self.edge_target[edge] = target
+            self.edge_segment[edge] = segment_id
+            self.edge_length[edge] = length
+            self.segment_edge[segment_id] = edge
+
+        # Per-edge speed statistics, used to weight the edges.
+        self.latest_speed = array("d", [0.0] * edge_count)
+        self.speed_sum = array("d", [0.0] * edge_count)
+        self.speed_count = array("q", [0] * edge_count)
+        self.max_speed = DEFAULT_SPEED
+        for edge in range(edge_count):
+            self._reweight(edge)
+
+        self.grid = {}
+        for node in range(node_count):
+            self.grid.setdefault(self._cell(self.node_lon[node], self.node_lat[node]), []).append(node)
+
+        # Every reading up to this id is applied to the graph. The pending id
+        # and the xmax of the snapshot it was seen in become the watermark
+        # once every transaction older than that xmax has ended.
+        self.watermark = 0
+        self.pending = None
+        # Every state is read again once the xmin passes this xmax.
+        self.reload_after = None
+        self.refreshed_at = 0.0
+        # Version of the road network the graph was built from.
+        self.version = 0
+
+    def _cell(self, lon, lat):
+        return (math.floor(lon / GRID_CELL_SIZE), math.floor(lat / GRID_CELL_SIZE))
+
+    def _reweight(self, edge):
+        """
+        Sets the weight of an edge from its latest speed, falling back to
+        the historical average and then to DEFAULT_SPEED.
+        """
+        speed = self.latest_speed[edge]
+        if speed <= 0 and self.speed_count[edge]:
+            speed = self.speed_sum[edge] / self.speed_count[edge]
+        if speed <= 0:
+            speed = DEFAULT_SPEED
+
+        self.max_speed = max(self.max_speed, speed)
+        self.edge_weight[edge] = self.edge_length[edge] / (speed / 3.6)
+
+    def set_speed_stats(self, segment_id, latest, average, count):
+        """Replaces the speed statistics of a segment and reweights its edge."""
+        edge = self.segment_edge.get(segment_id)
+        if edge is None:
+            return
+        self.latest_speed[edge] = latest or 0.0
+        self.speed_sum[edge] = (average or 0.0) * count
+        self.speed_count[edge] = count
+        self._reweight(edge)
+
+    def nearest_node(self, lon, lat):
+        """
+        Returns the node nearest to a point, searching the grid in growing
+        rings of cells, or None if there is no node close enough.
+        """
+        cell_x, cell_y = self._cell(lon, lat)
+        best, best_distance = None, math.inf
+        for ring in range(MAX_SNAP_RINGS + 1):
+            # Nodes in this ring and beyond are at least ring - 1 cells away.
+            # Cells are narrowest across the longitude, by the cosine of the
+            # latitude nearest to the pole that the ring reaches.
+            if best is not None:
+                far_lat = min(abs(lat) + (ring + 1) * GRID_CELL_SIZE, 90.0)
+                cell_width = (
+                    math.radians(GRID_CELL_SIZE) * EARTH_RADIUS * math.cos(math.radians(far_lat))
+                )
+                if (ring - 1) * cell_width > best_distance:
+                    break
+            for x in range(cell_x - ring, cell_x + ring + 1):
+                for y in range(cell_y - ring, cell_y + ring + 1):
+                    if max(abs(x - cell_x), abs(y - cell_y)) != ring:
+                        continue
+                    for node in self.grid.get((x, y), ()):
+                        distance = haversine(lon, lat, self.node_lon[node], self.node_lat[node])
+                        if distance < best_distance:
+                            best, best_distance = node, distance
+        return best
+
+    def shortest_path(self, source, target):
+        """
+        Finds the fastest path between two nodes with A*, using the
+        straight-line distance at the highest known speed as heuristic.
+        Returns the list of edges of the path, or None if there is no path.
+        """
+        scale = self.length_ratio / (self.max_speed / 3.6)
+        node_lon, node_lat = self.node_lon, self.node_lat
+        offsets, edge_target, edge_weight = self.offsets, self.edge_target, self.edge_weight
+        target_lon, target_lat = node_lon[target], node_lat[target]
+
+        def heuristic(node):
+            return haversine(node_lon[node], node_lat[node], target_lon, target_lat) * scale
+
+        best = {source: 0.0}
+        came_from = {}
+        queue = [(heuristic(source), 0.0, source)]
+        push, pop = heapq.heappush, heapq.heappop
+        while queue:
+            _, cost, node = pop(queue)
+            if node == target:
+                break
+            if cost > best[node]:
+                continue
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = edge_target[edge]
+                new_cost = cost + edge_weight[edge]
+                if new_cost < best.get(neighbour, math.inf):
+                    best[neighbour] = new_cost
+                    came_from[neighbour] = edge
+                    push(queue, (new_cost + heuristic(neighbour), new_cost, neighbour))
+        else:
+            return None
+
+        path = []
+        node = target
+        while node != source:
+            edge = came_from[node]
+            path.append(edge)
+            node = self.edge_source[edge]
+        path.reverse()
+        return path
+
+    def load_speeds(self):
+        """
+        Loads the latest and average speed of every segment from their
+        latest states, which are kept up to date as readings arrive, so the
+        reading history is never scanned.
+        """
+        self.watermark, _, xmax = reading_snapshot()
+        self.load_states(SegmentLatestState.objects.all())
+        # Transactions in flight may still commit readings up to the
+        # watermark, which the states read above do not include.
+        self.reload_after = xmax
+        self.pending = None
+        self.refreshed_at = time.monotonic()
+
+    def load_states(self, states):
+        """Replaces the speed statistics of the segments of the given latest states."""
+        rows = states.values_list("segment_id", "speed", "speed_sum", "reading_count")
+        for segment_id, latest, speed_sum, count in rows.iterator():
+            self.set_speed_stats(segment_id, latest, speed_sum / count if count else None, count)
+
+    def refresh(self):
+        """
+        Reads again the latest state of the segments with readings after the
+        watermark. Those are read on every refresh until they are behind the
+        watermark, so readings that commit after readings with higher ids are
+        not missed, and reading a state twice only sets the same speeds.
+        """
+        last_id, xmin, xmax = reading_snapshot()
+        if self.reload_after is not None and xmin >= self.reload_after:
+            self.load_states(SegmentLatestState.objects.all())
+            self.reload_after = None
+
+        recent = TrafficReading.objects.filter(id__gt=self.watermark).values("segment_id")
+        self.load_states(SegmentLatestState.objects.filter(segment_id__in=recent))
+
+        # The transactions that could commit readings up to the pending id had
+        # all ended before the states were read.
+        if self.pending is not None and xmin >= self.pending[1]:
+            self.watermark = self.pending[0]
+            self.pending = None
+        if self.pending is None:
+            self.pending = (last_id, xmax)
+        self.refreshed_at = time.monotonic()
+
+
+def current_network_version():
+    return NetworkVersion.objects.filter(pk=1).values_list("version", flat=True).first() or 0
+
+
+def network_changed():
+    """Marks the road network as changed, so that every process rebuilds its graph."""
+    if not NetworkVersion.objects.filter(pk=1).update(version=F("version") + 1):
+        NetworkVersion.objects.create(pk=1, version=1)
+
+
+def build_graph():
+    """Builds the graph of the current road network, with its speeds."""
+    version = current_network_version()
+    graph = RoadGraph(
+        RoadSegment.objects.values_list("id", "geometry", "length").iterator()
+    )
+    graph.load_speeds()
+    graph.version = version
+    return graph
+
+
+_graph = None
+_graph_lock = threading.Lock()
+_rebuilding = False
+
+
+def rebuild_graph():
+    """Builds a new graph and replaces the graph of this process with it."""
+    global _graph, _rebuilding
+    try:
+        graph = build_graph()
+        with _graph_lock:
+            _graph = graph
+    finally:
+        _rebuilding = False
+
+
+def _rebuild_in_background():
+    try:
+        rebuild_graph()
+    finally:
+        # The thread's connection would otherwise stay open.
+        connections.close_all()
+
+
+def start_rebuild():
+    """Rebuilds the graph in a background thread while the current one keeps being served."""
+    threading.Thread(target=_rebuild_in_background, daemon=True).start()
+
+
+def get_graph():
+    """
+    Returns the graph of this process, applying new readings at most every
+    ROUTING_REFRESH_INTERVAL seconds. The graph is built in the background,
+    on first use and when another process changed the road network; the
+    current one is served until the new one is ready, and None is returned
+    until the first one is.
+    """
+    global _graph, _rebuilding
+    interval = getattr(settings, "ROUTING_REFRESH_INTERVAL", 5)
+    with _graph_lock:
+        if _graph is None:
+            if not _rebuilding:
+                _rebuilding = True
+                start_rebuild()
+        elif time.monotonic() - _graph.refreshed_at >= interval:
+            if not _rebuilding and current_network_version() != _graph.version:
+                _rebuilding = True
+                start_rebuild()
+            _graph.refresh()
+        return _graph
+
+
+def invalidate_graph():
+    """Drops the graph of this process, so it is built again on next use."""
+    global _graph
+    with _graph_lock:
+        _graph = None
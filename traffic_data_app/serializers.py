@@ -1,9 +1,68 @@
 from rest_framework import serializers
-from .models import RoadSegment, TrafficReading
+from .models import RoadSegment, SegmentCoverage, SensorGap, TrafficReading
 from django.contrib.gis.geos import LineString
+from .bulk import UPSERT_KEYS
 
+# Largest number of segments accepted by one bulk upsert.
+BULK_UPSERT_MAX_SEGMENTS = 10000
 
-class TrafficReadingSerializer(serializers.ModelSerializer):
+# Number of most recent gaps returned with the coverage of a segment.
+RECENT_GAPS = 100
+
+
+def requested_fields(request):
+    """
+    Returns the field names listed in the 'fields' query parameter of a
+    read request, or None if every field should be returned.
+    """
+    if request is None or request.method not in ("GET", "HEAD"):
+        return None
+    value = request.query_params.get("fields")
+    if not value:
+        return None
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin that only keeps the fields requested with '?fields='.
+    field_columns maps the fields that are not plain model fields to the
+    columns they are computed from.
+    """
+    field_columns = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get("request"))
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def get_columns(cls, fields):
+        """
+        Returns the model columns needed to render the given fields.
+        Raises a ValidationError for unknown or write-only fields.
+        """
+        readable = {
+            name for name, field in cls().fields.items() if not field.write_only
+        }
+        unknown = [name for name in fields if name not in readable]
+        if unknown:
+            raise serializers.ValidationError(
+                {"fields": [f"Unknown field: {name}." for name in unknown]}
+            )
+
+        model_fields = {field.name for field in cls.Meta.model._meta.concrete_fields}
+        columns = {"pk"}
+        for name in fields:
+            columns.update(
+                cls.field_columns.get(name, (name,) if name in model_fields else ())
+            )
+        return columns
+
+
+class TrafficReadingSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for the TrafficReading model."""
     segment = serializers.PrimaryKeyRelatedField(queryset=RoadSegment.objects.all())
 
@@ -24,8 +83,15 @@ class TrafficReadingSerializer(serializers.ModelSerializer):
         return value
 
 
-class RoadSegmentSerializer(serializers.ModelSerializer):
+class RoadSegmentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for the RoadSegment model."""
+    field_columns = {
+        "long_start": ("geometry",),
+        "lat_start": ("geometry",),
+        "long_end": ("geometry",),
+        "lat_end": ("geometry",),
+    }
+
     long_start = serializers.SerializerMethodField(read_only=True)
     lat_start = serializers.SerializerMethodField(read_only=True)
     long_end = serializers.SerializerMethodField(read_only=True)
@@ -44,6 +110,7 @@ class RoadSegmentSerializer(serializers.ModelSerializer):
             "id",
             "uuid",
             "name",
+            "external_id",
             "length",
             "long_start",
             "lat_start",
@@ -89,7 +156,107 @@ class RoadSegmentSerializer(serializers.ModelSerializer):
 
         return super().create(validated_data)
 
+    def update(self, instance, validated_data):
+        # Any write-only coordinate that is given replaces the matching end of the line.
+        (long_start, lat_start), (long_end, lat_end) = instance.geometry.coords[0], instance.geometry.coords[-1]
+        coords = {
+            "long_start_write": long_start,
+            "lat_start_write": lat_start,
+            "long_end_write": long_end,
+            "lat_end_write": lat_end,
+        }
+        if any(name in validated_data for name in coords):
+            for name in coords:
+                coords[name] = validated_data.pop(name, coords[name])
+            validated_data["geometry"] = LineString(
+                (coords["long_start_write"], coords["lat_start_write"]),
+                (coords["long_end_write"], coords["lat_end_write"]),
+            )
+
+        return super().update(instance, validated_data)
+
+    def validate_length(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Length must be a positive number.")
+        return value
+
+
+class RoadSegmentBulkItemSerializer(serializers.Serializer):
+    """A segment of a bulk upsert, with the same write fields as RoadSegmentSerializer."""
+    uuid = serializers.UUIDField(required=False)
+    external_id = serializers.CharField(max_length=100, required=False)
+    name = serializers.CharField(max_length=200)
+    length = serializers.FloatField()
+    long_start_write = serializers.FloatField()
+    lat_start_write = serializers.FloatField()
+    long_end_write = serializers.FloatField()
+    lat_end_write = serializers.FloatField()
+
     def validate_length(self, value):
         if value <= 0:
             raise serializers.ValidationError("Length must be a positive number.")
         return value
+
+
+class RoadSegmentBulkUpsertSerializer(serializers.Serializer):
+    """Serializer for a bulk upsert of road segments matched by uuid or external_id."""
+    key = serializers.ChoiceField(choices=UPSERT_KEYS, default="external_id")
+    segments = RoadSegmentBulkItemSerializer(
+        many=True, allow_empty=False, max_length=BULK_UPSERT_MAX_SEGMENTS
+    )
+
+    def validate(self, data):
+        key = data["key"]
+        seen = set()
+        for index, segment in enumerate(data["segments"]):
+            value = segment.get(key)
+            if value is None:
+                if key == "uuid":
+                    # Segments without a uuid are created.
+                    continue
+                raise serializers.ValidationError(
+                    {"segments": f"Segment {index} has no {key}."}
+                )
+            if value in seen:
+                raise serializers.ValidationError(
+                    {"segments": f"Segment {index} repeats the {key} {value}."}
+                )
+            seen.add(value)
+        return data
+
+
+class StaleSegmentSerializer(serializers.ModelSerializer):
+    """A segment that has not reported recently, with when it was last seen."""
+    last_seen = serializers.DateTimeField(source="coverage.last_seen", read_only=True)
+
+    class Meta:
+        model = RoadSegment
+        fields = ("id", "uuid", "name", "external_id", "last_seen")
+
+
+class SensorGapSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SensorGap
+        fields = ("started_at", "ended_at", "duration")
+
+
+class SegmentCoverageSerializer(serializers.ModelSerializer):
+    """Serializer for the coverage of a segment, with its most recent gaps."""
+    gaps = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SegmentCoverage
+        fields = (
+            "segment",
+            "first_seen",
+            "last_seen",
+            "reading_count",
+            "gap_count",
+            "total_gap",
+            "longest_gap",
+            "gaps",
+        )
+
+    def get_gaps(self, obj):
+        gaps = SensorGap.objects.filter(segment_id=obj.segment_id).order_by("-started_at")
+        return SensorGapSerializer(gaps[:RECENT_GAPS], many=True).data
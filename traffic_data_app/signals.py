@@ -0,0 +1,28 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import heatmap
+from .models import RoadSegment, TrafficReading
+from .routing import network_changed
+
+
+@receiver(post_save, sender=RoadSegment)
+def road_segment_saved(sender, instance, **kwargs):
+    """Marks the routing graphs as out of date and moves the segment to its heatmap cells."""
+    network_changed()
+    heatmap.refresh_segment(instance.id)
+
+
+@receiver(post_delete, sender=RoadSegment)
+def road_segment_deleted(sender, instance, **kwargs):
+    """Marks the routing graphs as out of date and removes the segment from its heatmap cells."""
+    network_changed()
+    heatmap.segment_deleted(instance)
+
+
+@receiver(post_save, sender=TrafficReading)
+def traffic_reading_saved(sender, instance, created, **kwargs):
+    """Applies new readings to the latest state of their segment."""
+    if created:
+        heatmap.apply_reading(instance)
+
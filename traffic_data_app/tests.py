@@ -1,10 +1,36 @@
+import csv
+import functools
+import io
+import msgpack
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
 from rest_framework.test import APITestCase
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models.deletion import Collector
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from rest_framework.settings import api_settings
 from django.utils import timezone
 from datetime import timedelta
 from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
 from django.contrib.gis.geos import LineString
-from .models import RoadSegment, TrafficReading
+from .models import (
+    CoverageWatermark, HeatmapCell, RoadSegment, SegmentCoverage, SegmentLatestState, SensorGap,
+    TrafficReading,
+)
+from .management.commands import import_traffic_data, load_test
+from . import admin as traffic_admin, coverage, heatmap, routing, throttling, visibility
+from traffic_api import schema
 
 
 class APITests(APITestCase):
@@ -12,6 +38,17 @@ class APITests(APITestCase):
     Base class for all API tests.
     Sets up a test user and test data.
     """
+    # Throttling is disabled unless a test class enables it, so that tests
+    # do not share the token buckets of the test client.
+    throttled = False
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if not cls.throttled:
+            patcher = mock.patch.dict(api_settings.DEFAULT_THROTTLE_RATES, clear=True)
+            patcher.start()
+            cls.addClassCleanup(patcher.stop)
     
     @classmethod
     def setUpTestData(cls):
@@ -107,6 +144,36 @@ class RoadSegmentViewSetTests(APITests):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data['results']), 0)
 
+    def test_list_segments_with_sparse_fieldset(self):
+        """Checks that '?fields=' only returns the requested fields."""
+        url = reverse('roadsegment-list') + '?fields=id,name'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name'})
+
+    def test_sparse_fieldset_with_unknown_field_fails(self):
+        """Checks that requesting an unknown or write-only field fails."""
+        url = reverse('roadsegment-list') + '?fields=id,long_start_write'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.data)
+
+    def test_list_segments_as_msgpack(self):
+        """Checks that MessagePack is rendered when requested in the Accept header."""
+        url = reverse('roadsegment-list')
+        response = self.client.get(url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content)['count'], 4)
+
+    def test_list_segments_with_orjson_encoder(self):
+        """Checks that the orjson renderer is opt-in and returns the same data."""
+        url = reverse('roadsegment-list')
+        default = self.client.get(url)
+        fast = self.client.get(url, HTTP_ACCEPT='application/json; encoder=orjson')
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast.json(), default.json())
+
     def test_readings_count_action(self):
         """Checks if the custom 'readings_count' action works."""
         url = reverse('roadsegment-readings-count', args=[self.segment_high_speed.id])
@@ -144,6 +211,39 @@ class RoadSegmentViewSetTests(APITests):
         self.assertEqual(response.status_code, 400)
         self.assertIn('length', response.data)
 
+    def test_update_roadsegment_with_write_only_fields(self):
+        """Checks that a partial update with write-only coordinates moves one end of the line."""
+        url = reverse('roadsegment-detail', args=[self.segment_high_speed.id])
+        response = self.client.patch(url, {'long_end_write': 9.0}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.segment_high_speed.refresh_from_db()
+        self.assertEqual(self.segment_high_speed.geometry.coords, ((0.0, 0.0), (9.0, 1.0)))
+
+    def test_bulk_upsert_creates_and_updates_segments(self):
+        """Checks that a bulk upsert creates new segments and updates existing ones by external_id."""
+        RoadSegment.objects.filter(pk=self.segment_high_speed.pk).update(external_id='A')
+        url = reverse('roadsegment-bulk-upsert')
+        segment = {'length': 10.0, 'long_start_write': 0, 'lat_start_write': 0, 'long_end_write': 2, 'lat_end_write': 2}
+        data = {'segments': [
+            {**segment, 'external_id': 'A', 'name': 'Resurveyed'},
+            {**segment, 'external_id': 'B', 'name': 'New road'},
+        ]}
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated']), (1, 1))
+
+        self.segment_high_speed.refresh_from_db()
+        self.assertEqual(self.segment_high_speed.name, 'Resurveyed')
+        self.assertEqual(self.segment_high_speed.geometry.coords, ((0.0, 0.0), (2.0, 2.0)))
+        self.assertTrue(RoadSegment.objects.filter(external_id='B', latest_state__isnull=False).exists())
+
+    def test_bulk_upsert_rejects_repeated_keys(self):
+        """Checks that a bulk upsert cannot contain the same key twice."""
+        url = reverse('roadsegment-bulk-upsert')
+        segment = {'external_id': 'A', 'name': 'A', 'length': 10.0, 'long_start_write': 0, 'lat_start_write': 0, 'long_end_write': 1, 'lat_end_write': 1}
+        response = self.client.post(url, {'segments': [segment, segment]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
     def test_unauthenticated_user_cannot_create_segment(self):
         """Checks if an unauthenticated user is denied write access."""
         self.client.force_authenticate(user=None)
@@ -208,4 +308,567 @@ class TrafficReadingViewSetTests(APITests):
         
         response = self.client.delete(url)
         self.assertEqual(response.status_code, 403)
-        self.assertTrue(TrafficReading.objects.filter(id=reading_to_delete.id).exists())
\ No newline at end of file
+        self.assertTrue(TrafficReading.objects.filter(id=reading_to_delete.id).exists())
+
+
+class ImportTrafficDataShardingTests(SimpleTestCase):
+    """
+    Tests for the sharding used by the parallel import.
+    """
+    csv_path = 'traffic_data_app/data/traffic_speed.csv'
+
+    def test_shards_cover_every_row_exactly_once(self):
+        """Checks that splitting the file into shards neither loses nor duplicates rows."""
+        with open(self.csv_path, encoding='utf-8') as file:
+            expected_rows = list(csv.reader(file))[1:]
+
+        with mock.patch.object(import_traffic_data, 'MIN_SHARD_SIZE', 1000):
+            shards = import_traffic_data.plan_shards([self.csv_path], workers=8)
+
+        self.assertGreater(len(shards), 1)
+        rows = [row for shard in shards for row in import_traffic_data.iter_shard_rows(*shard)]
+        self.assertEqual(rows, expected_rows)
+
+    def test_scan_segments_keeps_first_occurrence(self):
+        """Checks that every segment is found once, with the values of its first row."""
+        columns = import_traffic_data.read_header(self.csv_path)
+        shards = import_traffic_data.plan_shards([self.csv_path], workers=1)
+        segments = import_traffic_data.scan_segments(shards[0], columns)
+
+        self.assertEqual(segments[1][:2], (103.9460064, 30.75066046))
+
+
+class ImportTrafficDataTests(TransactionTestCase):
+    """
+    Tests for the serial and parallel imports against the database.
+    """
+    def setUp(self):
+        # The first 400 readings keep the import quick, and still give several shards.
+        with open(ImportTrafficDataShardingTests.csv_path, encoding='utf-8') as file:
+            lines = file.readlines()[:401]
+        handle, self.csv_path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w', encoding='utf-8') as file:
+            file.writelines(lines)
+        self.addCleanup(os.remove, self.csv_path)
+
+    def import_data(self, **options):
+        call_command(
+            'import_traffic_data', traffic_speed_path=self.csv_path,
+            stdout=io.StringIO(), stderr=io.StringIO(), **options,
+        )
+        return RoadSegment.objects.count(), TrafficReading.objects.count()
+
+    def test_parallel_import_matches_serial_import(self):
+        """Checks that loading the shards with COPY in workers gives the same rows."""
+        version = routing.current_network_version()
+        serial = self.import_data()
+        self.assertEqual(serial[1], 400)
+        self.assertGreater(routing.current_network_version(), version)
+        call_command('import_traffic_data', discard=True, interactive=False, stdout=io.StringIO())
+        self.assertFalse(RoadSegment.objects.exists())
+
+        # Forked workers inherit the settings that point at the test database.
+        pool = functools.partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context('fork'))
+        with mock.patch.object(import_traffic_data, 'MIN_SHARD_SIZE', 1000), \
+                mock.patch.object(import_traffic_data, 'COPY_BATCH_ROWS', 50), \
+                mock.patch.object(import_traffic_data, 'ProcessPoolExecutor', pool):
+            self.assertEqual(self.import_data(workers=3), serial)
+        self.assertEqual(SegmentLatestState.objects.count(), serial[0])
+
+    def test_failed_import_deletes_only_what_it_created(self):
+        """Checks that a failed import removes its own segments and readings, and nothing else."""
+        def rebuild():
+            # A segment created through the API while the import runs.
+            RoadSegment.objects.create(name='Other', length=1.0, geometry=LineString((0, 0), (1, 1)))
+            raise RuntimeError('interrupted')
+
+        with mock.patch.object(heatmap, 'rebuild', side_effect=rebuild):
+            with self.assertRaises(CommandError):
+                self.import_data()
+        self.assertEqual(list(RoadSegment.objects.values_list('name', flat=True)), ['Other'])
+        self.assertFalse(TrafficReading.objects.exists())
+        self.assertEqual(SegmentLatestState.objects.count(), 1)
+
+    def test_discard_asks_for_confirmation(self):
+        """Checks that --discard keeps the network unless the prompt is answered with yes."""
+        self.import_data()
+        with mock.patch('builtins.input', return_value='no'):
+            call_command('import_traffic_data', discard=True, stdout=io.StringIO())
+        self.assertTrue(RoadSegment.objects.exists())
+
+
+@override_settings(ROUTING_REFRESH_INTERVAL=0)
+class RouteViewTests(APITests):
+    """
+    Tests for the fastest route endpoint.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # A direct but slow segment, and a detour of two fast segments.
+        cls.direct = RoadSegment.objects.create(
+            name='Direct', length=1000.0, geometry=LineString((20, 0), (20, 0.02))
+        )
+        cls.detour_a = RoadSegment.objects.create(
+            name='Detour A', length=1000.0, geometry=LineString((20, 0), (20.01, 0.01))
+        )
+        cls.detour_b = RoadSegment.objects.create(
+            name='Detour B', length=1000.0, geometry=LineString((20.01, 0.01), (20, 0.02))
+        )
+        TrafficReading.objects.create(segment=cls.direct, speed_measured=10.0)
+        TrafficReading.objects.create(segment=cls.detour_a, speed_measured=100.0)
+        TrafficReading.objects.create(segment=cls.detour_b, speed_measured=100.0)
+
+    def setUp(self):
+        # Built here, as the background thread could not see the test's data.
+        routing.rebuild_graph()
+        self.url = reverse('routes') + '?from=20,0&to=20,0.02'
+
+    def test_route_takes_fastest_path(self):
+        """Checks that the route prefers the faster detour over the slow direct segment."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['segments'], [self.detour_a.id, self.detour_b.id])
+        self.assertEqual(response.data['length'], 2000.0)
+        self.assertAlmostEqual(response.data['eta_seconds'], 72.0)
+
+    def test_route_is_reweighted_by_new_readings(self):
+        """Checks that new readings change the route without rebuilding the graph."""
+        self.client.get(self.url)
+        TrafficReading.objects.create(segment=self.detour_a, speed_measured=5.0)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['segments'], [self.direct.id])
+
+    def test_route_with_invalid_point_fails(self):
+        """Checks that malformed coordinates are rejected."""
+        response = self.client.get(reverse('routes') + '?from=20&to=20,0.02')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('routes') + '?from=inf,0&to=20,0.02')
+        self.assertEqual(response.status_code, 400)
+
+    def test_graph_is_rebuilt_when_network_changes_elsewhere(self):
+        """Checks that a change made by another process is picked up in the background."""
+        self.client.get(self.url)
+        routing.network_changed()
+        with mock.patch.object(routing, 'start_rebuild') as start_rebuild:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        start_rebuild.assert_called_once()
+
+        routing.rebuild_graph()
+        self.assertEqual(routing.get_graph().version, routing.current_network_version())
+
+    def test_first_graph_is_built_in_the_background(self):
+        """Checks that a process without a graph starts building one and answers 503."""
+        routing.invalidate_graph()
+        with mock.patch.object(routing, 'start_rebuild') as start_rebuild:
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 503)
+            self.assertIn('Retry-After', response)
+            self.client.get(self.url)
+        start_rebuild.assert_called_once()
+        routing.rebuild_graph()
+
+    def test_watermark_waits_for_transactions_in_flight(self):
+        """Checks that the watermark only passes readings once no older transaction can commit more."""
+        graph = routing.get_graph()
+        watermark = graph.watermark
+        TrafficReading.objects.create(segment=self.detour_a, speed_measured=5.0)
+        last_id, xmin, xmax = visibility.reading_snapshot()
+        # An older transaction is still running, and may commit lower reading ids.
+        with mock.patch.object(routing, 'reading_snapshot', return_value=(last_id, xmin - 1, xmax)):
+            graph.refresh()
+            graph.refresh()
+        self.assertEqual(graph.watermark, watermark)
+        self.assertEqual(self.client.get(self.url).data['segments'], [self.direct.id])
+        self.assertEqual(graph.watermark, last_id)
+
+    def test_nearest_node_away_from_the_equator(self):
+        """Checks that a node further away in cells, but closer in metres, is found."""
+        # At 80 degrees, a cell is about 190 m wide but 1.1 km high.
+        graph = routing.RoadGraph([(1, LineString((0.005, 80.016), (0.035, 80.005)), 1000.0)])
+        self.assertEqual(graph.nearest_node(0.005, 80.005), 1)
+
+
+class ThrottlingTests(APITests):
+    """
+    Tests for the token bucket throttle and the concurrency limits.
+    """
+    throttled = True
+
+    def setUp(self):
+        throttling.get_bucket_store().clear()
+        self.client.force_authenticate(user=self.admin_user)
+
+    def test_writes_are_throttled_separately_from_reads(self):
+        """Checks that an exhausted write budget does not block reads."""
+        url = reverse('trafficreading-list')
+        data = {'speed_measured': 50.0, 'segment': self.segment_high_speed.id}
+        with mock.patch.dict(api_settings.DEFAULT_THROTTLE_RATES, {'write': '1/min'}):
+            self.assertEqual(self.client.post(url, data, format='json').status_code, 201)
+            response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('Retry-After', response)
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(CONCURRENCY_LIMITS={'expensive': 0})
+    def test_expensive_reads_are_shed_over_concurrency_limit(self):
+        """Checks that requests over the concurrency cap of their class get a 503."""
+        url = reverse('roadsegment-list')
+        response = self.client.get(url + '?last_reading_characterization=high_speed')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_metrics_are_exported(self):
+        """Checks that the throttling counters are exported for monitoring."""
+        self.client.get(reverse('roadsegment-list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('traffic_api_throttle_allowed_total{scope="read"}', response.content.decode())
+
+    def test_bucket_keys_do_not_contain_the_token(self):
+        """Checks that clients are told apart by a hash of their token."""
+        token = Token.objects.create(user=self.regular_user)
+        request = mock.Mock(auth=token)
+        key = throttling.TokenBucketThrottle().get_client_key(request)
+        self.assertNotIn(token.key, key)
+        self.assertEqual(key, throttling.TokenBucketThrottle().get_client_key(mock.Mock(auth=token)))
+
+    def test_metrics_require_staff(self):
+        """Checks that the counters are not exported to anonymous or regular users."""
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        self.client.force_authenticate(user=self.regular_user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+
+class AsyncReadViewTests(APITests):
+    """
+    Tests for the async read endpoints, which must match the DRF viewsets.
+    """
+    def test_async_list_matches_sync_list(self):
+        """Checks that the async list returns the same data as the viewset."""
+        query = '?last_reading_characterization=high_speed&fields=id,name,long_start'
+        sync = self.client.get(reverse('roadsegment-list') + query)
+        async_ = self.client.get(reverse('async-roadsegment-list') + query)
+        self.assertEqual(async_.status_code, 200)
+        self.assertEqual(async_.json()['results'], sync.json()['results'])
+        self.assertEqual(async_.json()['count'], 1)
+
+    def test_async_detail_and_readings_count(self):
+        """Checks the async retrieve and readings_count endpoints."""
+        pk = self.segment_high_speed.id
+        detail = self.client.get(reverse('async-roadsegment-detail', args=[pk]))
+        self.assertEqual(detail.json(), self.client.get(reverse('roadsegment-detail', args=[pk])).json())
+
+        count = self.client.get(reverse('async-roadsegment-readings-count', args=[pk]))
+        self.assertEqual(count.json(), {'readings_count': 1})
+
+    def test_async_detail_not_found(self):
+        """Checks that an unknown segment returns a 404."""
+        response = self.client.get(reverse('async-roadsegment-detail', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_async_list_readings_filtered_by_segment(self):
+        """Checks that readings are filtered by segment, and invalid segments are rejected."""
+        url = reverse('async-trafficreading-list')
+        response = self.client.get(url + f'?segment={self.segment_low_speed.id}')
+        self.assertEqual(response.json()['count'], 1)
+        self.assertEqual(self.client.get(url + '?segment=0').status_code, 400)
+
+    def test_async_views_authenticate_tokens(self):
+        """Checks that valid tokens are accepted and invalid ones rejected."""
+        token = Token.objects.create(user=self.regular_user)
+        url = reverse('async-roadsegment-list')
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=f'Token {token.key}').status_code, 200)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Token invalid')
+        self.assertEqual(response.status_code, 401)
+
+
+class HeatmapTests(APITests):
+    """
+    Tests for the precomputed heatmap cells and the heatmap endpoint.
+    """
+    def setUp(self):
+        heatmap.update()
+        self.url = reverse('heatmap') + '?bbox=0,0,5,5&zoom=0'
+
+    def test_heatmap_averages_latest_speeds(self):
+        """Checks that a cell averages the latest speed of the segments inside it."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['cells']), 1)
+        cell = response.data['cells'][0]
+        self.assertEqual(cell['segments'], 3)
+        self.assertEqual(cell['readings'], 3)
+        self.assertAlmostEqual(cell['average_speed'], (65.0 + 35.0 + 15.0) / 3)
+
+    def test_heatmap_is_updated_with_new_readings(self):
+        """Checks that a new reading replaces the segment's latest speed in its cells."""
+        TrafficReading.objects.create(segment=self.segment_high_speed, speed_measured=95.0)
+        self.assertEqual(heatmap.update(), 1)
+        cell = self.client.get(self.url).data['cells'][0]
+        self.assertEqual(cell['readings'], 4)
+        self.assertAlmostEqual(cell['average_speed'], (95.0 + 35.0 + 15.0) / 3)
+
+    def test_rebuild_matches_incremental_updates(self):
+        """Checks that rebuilding the cells from scratch gives the same result."""
+        TrafficReading.objects.create(segment=self.segment_no_reading, speed_measured=40.0)
+        heatmap.update()
+        fields = ('geohash', 'segment_count', 'reporting_count', 'speed_sum', 'reading_count')
+        incremental = sorted(HeatmapCell.objects.values_list(*fields))
+        heatmap.rebuild()
+        self.assertEqual(sorted(HeatmapCell.objects.values_list(*fields)), incremental)
+
+    def test_heatmap_rejects_too_many_cells(self):
+        """Checks that a huge viewport at a high zoom is rejected."""
+        response = self.client.get(reverse('heatmap') + '?bbox=-180,-90,180,90&zoom=20')
+        self.assertEqual(response.status_code, 400)
+
+    def test_heatmap_rejects_non_finite_bbox(self):
+        """Checks that infinite or NaN coordinates are rejected, and large ones clamped."""
+        response = self.client.get(reverse('heatmap') + '?bbox=-inf,0,5,5&zoom=3')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('heatmap') + '?bbox=0,0,5,nan&zoom=3')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('heatmap') + '?bbox=-1000,-1000,1000,1000&zoom=0')
+        self.assertEqual(response.status_code, 200)
+
+    def test_deleting_a_reading_refreshes_its_segment(self):
+        """Checks that deleting the latest reading through the API restores the previous one."""
+        reading = TrafficReading.objects.create(segment=self.segment_high_speed, speed_measured=95.0)
+        self.client.force_authenticate(user=self.admin_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('trafficreading-detail', args=[reading.id]))
+        self.assertEqual(response.status_code, 204)
+        cell = self.client.get(self.url).data['cells'][0]
+        self.assertEqual(cell['readings'], 3)
+        self.assertAlmostEqual(cell['average_speed'], (65.0 + 35.0 + 15.0) / 3)
+
+    def test_readings_are_deleted_without_loading_them(self):
+        """Checks that no signal receiver keeps Django from deleting readings in bulk."""
+        collector = Collector(using='default')
+        self.assertTrue(collector.can_fast_delete(TrafficReading.objects.all()))
+
+
+class AdminTests(APITests):
+    """
+    Tests for the admin changelists on large tables.
+    """
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+        self.url = reverse('admin:traffic_data_app_trafficreading_changelist')
+
+    def test_reading_changelist_does_not_query_per_row(self):
+        """Checks that the segment of each reading is loaded with the readings."""
+        with CaptureQueriesContext(connection) as few_rows:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        for _ in range(10):
+            TrafficReading.objects.create(segment=self.segment_high_speed, speed_measured=50.0)
+        with CaptureQueriesContext(connection) as more_rows:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(len(more_rows), len(few_rows))
+
+    def test_segment_filter(self):
+        """Checks that readings can be filtered by segment id."""
+        response = self.client.get(self.url, {'segment': self.segment_low_speed.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [reading.segment_id for reading in response.context['cl'].result_list],
+            [self.segment_low_speed.pk],
+        )
+
+    def test_date_range_filter(self):
+        """Checks that readings can be filtered by a range of days, and bad dates are rejected."""
+        TrafficReading.objects.filter(segment=self.segment_low_speed).update(
+            timestamp=timezone.now() - timedelta(days=10)
+        )
+        today = timezone.localdate().isoformat()
+        response = self.client.get(self.url, {'timestamp_from': today, 'timestamp_to': today})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(
+            self.segment_low_speed.pk,
+            [reading.segment_id for reading in response.context['cl'].result_list],
+        )
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+
+        response = self.client.get(self.url, {'timestamp_from': 'yesterday'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_paginator_uses_estimate_above_threshold(self):
+        """Checks that the planner's estimate replaces COUNT(*) above the threshold."""
+        queryset = TrafficReading.objects.order_by('-pk')
+        self.assertEqual(traffic_admin.EstimatedCountPaginator(queryset, 20).count, 3)
+        with mock.patch.object(traffic_admin, 'ESTIMATED_COUNT_THRESHOLD', 0):
+            paginator = traffic_admin.EstimatedCountPaginator(queryset, 20)
+            self.assertEqual(paginator.count, traffic_admin.estimated_count(queryset))
+
+
+@override_settings(COVERAGE_SETTLE_SECONDS=0, SENSOR_GAP_THRESHOLD=15 * 60)
+class CoverageTests(APITests):
+    """
+    Tests for the incremental coverage and gap tables and their endpoints.
+    """
+    def setUp(self):
+        self.start = timezone.now() - timedelta(hours=3)
+
+    def add_reading(self, segment, minutes):
+        reading = TrafficReading.objects.create(segment=segment, speed_measured=50.0)
+        timestamp = self.start + timedelta(minutes=minutes)
+        TrafficReading.objects.filter(pk=reading.pk).update(timestamp=timestamp)
+
+    def update_coverage(self, batch_size=None):
+        """Runs the update twice, as the first run only sees the new readings."""
+        return coverage.update(batch_size) + coverage.update(batch_size)
+
+    def test_readings_wait_for_the_pending_horizon(self):
+        """Checks that readings are applied by the run after the one that saw them."""
+        self.assertEqual(coverage.update(), 0)
+        self.assertEqual(coverage.update(), 3)
+
+        self.add_reading(self.segment_no_reading, 0)
+        self.assertEqual(coverage.update(), 0)
+        with override_settings(COVERAGE_SETTLE_SECONDS=3600):
+            self.assertEqual(coverage.update(), 0)
+        watermark = CoverageWatermark.objects.get()
+        self.assertEqual(watermark.pending_reading_id, TrafficReading.objects.latest('id').id)
+        self.assertEqual(coverage.update(), 1)
+
+    def test_gaps_are_found_across_runs(self):
+        """Checks that a gap between readings applied in different runs is recorded."""
+        self.add_reading(self.segment_no_reading, 0)
+        self.add_reading(self.segment_no_reading, 5)
+        self.assertEqual(self.update_coverage(), 5)
+        self.assertFalse(SensorGap.objects.filter(segment=self.segment_no_reading).exists())
+
+        self.add_reading(self.segment_no_reading, 65)
+        self.add_reading(self.segment_no_reading, 70)
+        self.assertEqual(self.update_coverage(batch_size=1), 2)
+
+        gap = SensorGap.objects.get(segment=self.segment_no_reading)
+        self.assertEqual(gap.started_at, self.start + timedelta(minutes=5))
+        self.assertEqual(gap.duration, timedelta(hours=1))
+        state = SegmentCoverage.objects.get(segment=self.segment_no_reading)
+        self.assertEqual(state.reading_count, 4)
+        self.assertEqual(state.gap_count, 1)
+        self.assertEqual(state.last_seen, self.start + timedelta(minutes=70))
+
+    def test_rebuild_matches_incremental_updates(self):
+        """Checks that applying every reading again gives the same tables."""
+        self.add_reading(self.segment_no_reading, 0)
+        self.update_coverage()
+        self.add_reading(self.segment_no_reading, 30)
+        self.update_coverage()
+        fields = ('segment', 'first_seen', 'last_seen', 'reading_count', 'gap_count', 'total_gap')
+        incremental = sorted(SegmentCoverage.objects.values_list(*fields))
+        coverage.rebuild(batch_size=2)
+        self.assertEqual(sorted(SegmentCoverage.objects.values_list(*fields)), incremental)
+
+    def test_stale_segments(self):
+        """Checks that segments that never or no longer report are listed as stale."""
+        self.add_reading(self.segment_no_reading, 0)
+        self.update_coverage()
+        response = self.client.get(reverse('roadsegment-stale'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data['results']], [self.segment_no_reading.id])
+
+        response = self.client.get(reverse('roadsegment-stale'), {'older_than': 4 * 3600})
+        self.assertEqual(response.data['count'], 0)
+
+        for older_than in (-1, 100000000000, 'soon'):
+            response = self.client.get(reverse('roadsegment-stale'), {'older_than': older_than})
+            self.assertEqual(response.status_code, 400)
+
+    def test_segment_coverage(self):
+        """Checks the coverage endpoint, with and without readings."""
+        self.add_reading(self.segment_no_reading, 0)
+        self.add_reading(self.segment_no_reading, 20)
+        self.update_coverage()
+        response = self.client.get(reverse('roadsegment-coverage', args=[self.segment_no_reading.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['reading_count'], 2)
+        self.assertEqual(len(response.data['gaps']), 1)
+
+        segment = RoadSegment.objects.create(name='New', length=1.0, geometry=LineString((8, 8), (9, 9)))
+        response = self.client.get(reverse('roadsegment-coverage', args=[segment.id]))
+        self.assertEqual(response.data['reading_count'], 0)
+        self.assertIsNone(response.data['last_seen'])
+
+
+class LoadTestReportTests(SimpleTestCase):
+    """
+    Tests for the summaries and baseline comparisons of the load_test command.
+    """
+    def results(self, throughput, p99, lock_wait):
+        return {'endpoints': {load_test.WRITE_ENDPOINT: {
+            'throughput': throughput, 'p95': p99, 'p99': p99, 'lock_wait_seconds': lock_wait,
+        }}}
+
+    def test_summarize_counts_errors_apart(self):
+        """Checks that failed requests are counted, but left out of throughput and latency."""
+        samples = [(201, 0.010)] * 98 + [(201, 0.500), (400, 5.0)]
+        summary = load_test.summarize(samples, 2.0, {'seconds': 0.3, 'max_waiting': 2})
+        self.assertEqual(summary['requests'], 100)
+        self.assertEqual(summary['errors'], 1)
+        self.assertAlmostEqual(summary['throughput'], 49.5)
+        self.assertAlmostEqual(summary['p50'], 10.0)
+        self.assertLess(summary['p99'], 5000.0)
+        self.assertEqual(summary['max_waiting'], 2)
+
+    def test_find_regressions(self):
+        """Checks that only degradations beyond the tolerance are reported."""
+        baseline = self.results(100.0, 50.0, 0.0)
+        self.assertEqual(load_test.find_regressions(baseline, self.results(90.0, 55.0, 0.2), 0.2), [])
+        regressions = load_test.find_regressions(baseline, self.results(70.0, 80.0, 2.0), 0.2)
+        self.assertEqual(len(regressions), 4)
+        self.assertEqual(
+            load_test.find_regressions(baseline, {'endpoints': {}}, 0.2),
+            [f'{load_test.WRITE_ENDPOINT}: missing from the results'],
+        )
+
+
+class SchemaTests(SimpleTestCase):
+    """
+    Tests for serving the precomputed OpenAPI schema and for the worker startup.
+    """
+    def setUp(self):
+        schema._schema = None
+        self.addCleanup(setattr, schema, '_schema', None)
+
+    def test_precomputed_schema_is_served_with_etag(self):
+        """Checks that the schema file is served, and revalidated with its ETag."""
+        with tempfile.NamedTemporaryFile(suffix='.yml') as file:
+            file.write(b'openapi: 3.0.3\n')
+            file.flush()
+            with override_settings(OPENAPI_SCHEMA_PATH=file.name):
+                response = self.client.get(reverse('schema'))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, b'openapi: 3.0.3\n')
+
+                cached = self.client.get(reverse('schema'), HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(cached.status_code, 304)
+
+    def test_drf_spectacular_is_not_imported_at_startup(self):
+        """Checks that starting a worker imports no part of drf-spectacular."""
+        code = (
+            "import sys; from traffic_api.wsgi import application; import traffic_api.urls; "
+            "print(sorted(name for name in sys.modules if name.startswith('drf_spectacular')))"
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'traffic_api.settings'}
+        env.pop('SERVE_API_DOCS', None)
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_missing_schema_is_not_generated_without_the_docs(self):
+        """Checks that the schema and docs are not generated by a worker without drf-spectacular."""
+        with mock.patch.object(schema, 'can_generate', return_value=False):
+            with override_settings(OPENAPI_SCHEMA_PATH='/nonexistent/openapi-schema.yml'):
+                self.assertEqual(self.client.get(reverse('schema')).status_code, 404)
+            self.assertEqual(self.client.get(reverse('swagger-ui')).status_code, 404)
@@ -0,0 +1,249 @@
+import hashlib
+import math
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.utils.module_loading import import_string
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# Query parameters that make a read expensive for the database.
+EXPENSIVE_QUERY_PARAMS = {"last_reading_characterization"}
+
+# Endpoints that are always expensive to serve.
+EXPENSIVE_PATHS = ("/api/routes/",)
+
+# Counters exported by the metrics endpoint, keyed by (name, scope).
+metrics = Counter()
+_metrics_lock = threading.Lock()
+
+# Prometheus name and type of every counter.
+METRIC_NAMES = {
+    "allowed": ("traffic_api_throttle_allowed_total", "counter"),
+    "throttled": ("traffic_api_throttle_throttled_total", "counter"),
+    "shed": ("traffic_api_shed_total", "counter"),
+    "in_flight": ("traffic_api_in_flight", "gauge"),
+}
+
+
+def record(name, scope, amount=1):
+    with _metrics_lock:
+        metrics[(name, scope)] += amount
+
+
+def classify_request(request):
+    """
+    Returns the budget a request is charged to: 'write' for unsafe methods,
+    'expensive' for heavy filters and endpoints, and 'read' otherwise.
+    """
+    if request.method not in SAFE_METHODS:
+        return "write"
+    if request.path.startswith(EXPENSIVE_PATHS) or EXPENSIVE_QUERY_PARAMS & set(request.GET):
+        return "expensive"
+    return "read"
+
+
+def parse_rate(rate):
+    """Parses a DRF style rate such as '100/min' into (tokens, seconds)."""
+    num, period = rate.split("/")
+    duration = {"s": 1, "m": 60, "h": 3600, "d": 86400}[period[0]]
+    return int(num), duration
+
+
+class LocalBucketStore:
+    """
+    Keeps the token buckets in the memory of this process.
+    Buckets that have been idle long enough to be full again are dropped.
+    """
+
+    prune_every = 10000
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def consume(self, key, capacity, refill_rate, now):
+        """
+        Takes one token from the bucket. Returns (allowed, wait), where wait
+        is the number of seconds until a token is available.
+        """
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+
+            self.calls += 1
+            if self.calls % self.prune_every == 0:
+                self.prune(now)
+
+        return allowed, 0 if allowed else (1 - tokens) / refill_rate
+
+    def prune(self, now):
+        # The longest refill time of any budget bounds how long a bucket can stay partial.
+        full_after = max(
+            duration for _, duration in map(parse_rate, api_settings.DEFAULT_THROTTLE_RATES.values())
+        )
+        self.buckets = {
+            key: value for key, value in self.buckets.items() if now - value[1] < full_after
+        }
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheBucketStore:
+    """
+    Keeps the token buckets in the Django cache, so they are shared between
+    processes when the cache is. With the default local-memory cache it
+    behaves like LocalBucketStore. The read-modify-write is not atomic, so
+    concurrent requests for the same key may occasionally both be allowed.
+    """
+
+    prefix = "throttle:bucket:"
+
+    def consume(self, key, capacity, refill_rate, now):
+        cache_key = self.prefix + key
+        tokens, updated = cache.get(cache_key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill_rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        cache.set(cache_key, (tokens, now), timeout=math.ceil(capacity / refill_rate))
+        return allowed, 0 if allowed else (1 - tokens) / refill_rate
+
+
+_store = None
+
+
+def get_bucket_store():
+    """Returns the bucket store selected by THROTTLE_BUCKET_STORE."""
+    global _store
+    if _store is None:
+        path = getattr(settings, "THROTTLE_BUCKET_STORE", "traffic_data_app.throttling.LocalBucketStore")
+        _store = import_string(path)()
+    return _store
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket throttle keyed by auth token, or by IP for anonymous clients.
+    Every request is charged to the budget returned by classify_request, whose
+    size and refill period come from DEFAULT_THROTTLE_RATES (e.g. '600/min'
+    allows bursts of 600 requests, refilled over a minute).
+    """
+
+    timer = time.monotonic
+
+    def allow_request(self, request, view):
+        scope = classify_request(request)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+
+        capacity, duration = parse_rate(rate)
+        allowed, self.wait_time = get_bucket_store().consume(
+            f"{scope}:{self.get_client_key(request)}", capacity, capacity / duration, self.timer()
+        )
+        record("allowed" if allowed else "throttled", scope)
+        return allowed
+
+    def get_client_key(self, request):
+        token = getattr(request.auth, "key", None)
+        if token:
+            # Bucket keys can end up in a shared cache, so the token itself is not used.
+            return f"token:{hashlib.sha256(token.encode()).hexdigest()}"
+        if request.user and request.user.is_authenticated:
+            return f"user:{request.user.pk}"
+        return f"ip:{self.get_ident(request)}"
+
+    def wait(self):
+        return self.wait_time
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Caps the number of API requests of every class (see classify_request)
+    that this process serves at the same time. Requests over the cap in
+    CONCURRENCY_LIMITS are shed with a 503 before touching the database.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.in_flight = Counter()
+        self.lock = threading.Lock()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not request.path.startswith("/api/"):
+            return self.get_response(request)
+
+        scope, rejected = self.admit(request)
+        if rejected:
+            return rejected
+        try:
+            return self.get_response(request)
+        finally:
+            self.release(scope)
+
+    async def __acall__(self, request):
+        if not request.path.startswith("/api/"):
+            return await self.get_response(request)
+
+        scope, rejected = self.admit(request)
+        if rejected:
+            return rejected
+        try:
+            return await self.get_response(request)
+        finally:
+            self.release(scope)
+
+    def admit(self, request):
+        """
+        Counts the request as in flight, or returns a 503 response if its
+        class is already at the limit.
+        """
+        scope = classify_request(request)
+        limit = getattr(settings, "CONCURRENCY_LIMITS", {}).get(scope)
+        with self.lock:
+            if limit is not None and self.in_flight[scope] >= limit:
+                record("shed", scope)
+                response = JsonResponse(
+                    {"detail": "Server is busy, please retry later."}, status=503
+                )
+                response["Retry-After"] = "1"
+                return scope, response
+            self.in_flight[scope] += 1
+            record("in_flight", scope)
+        return scope, None
+
+    def release(self, scope):
+        with self.lock:
+            self.in_flight[scope] -= 1
+            record("in_flight", scope, -1)
+
+
+def render_metrics():
+    """Renders the counters in the Prometheus text format."""
+    lines = [f"# TYPE {metric} {kind}" for metric, kind in METRIC_NAMES.values()]
+    with _metrics_lock:
+        for (name, scope), value in sorted(metrics.items()):
+            lines.append(f'{METRIC_NAMES[name][0]}{{scope="{scope}"}} {value}')
+    return "\n".join(lines) + "\n"
@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import RoadSegmentViewSet, TrafficReadingViewSet
+from .views import RoadSegmentViewSet, TrafficReadingViewSet, RouteView, HeatmapView, MetricsView
+from . import async_views
 
 router = DefaultRouter()
 router.register("roadsegments", RoadSegmentViewSet, basename="roadsegment")
@@ -8,4 +9,32 @@ router.register("trafficreadings", TrafficReadingViewSet, basename="trafficreadi
 
 urlpatterns = [
     path("", include(router.urls)),
+    path("routes/", RouteView.as_view(), name="routes"),
+    path("heatmap/", HeatmapView.as_view(), name="heatmap"),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    path(
+        "async/roadsegments/",
+        async_views.RoadSegmentAsyncListView.as_view(),
+        name="async-roadsegment-list",
+    ),
+    path(
+        "async/roadsegments/<pk>/",
+        async_views.RoadSegmentAsyncDetailView.as_view(),
+        name="async-roadsegment-detail",
+    ),
+    path(
+        "async/roadsegments/<pk>/readings_count/",
+        async_views.RoadSegmentAsyncReadingsCountView.as_view(),
+        name="async-roadsegment-readings-count",
+    ),
+    path(
+        "async/trafficreadings/",
+        async_views.TrafficReadingAsyncListView.as_view(),
+        name="async-trafficreading-list",
+    ),
+    path(
+        "async/trafficreadings/<pk>/",
+        async_views.TrafficReadingAsyncDetailView.as_view(),
+        name="async-trafficreading-detail",
+    ),
 ]
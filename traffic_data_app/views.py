@@ -1,18 +1,56 @@
-from rest_framework import viewsets
-from .models import RoadSegment, TrafficReading
-from .serializers import RoadSegmentSerializer, TrafficReadingSerializer
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status, viewsets
+from .models import RoadSegment, SegmentCoverage, TrafficReading
+from .serializers import (
+    RoadSegmentBulkUpsertSerializer,
+    RoadSegmentSerializer,
+    SegmentCoverageSerializer,
+    StaleSegmentSerializer,
+    TrafficReadingSerializer,
+    requested_fields,
+)
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from .permissions import IsAdminUserOrReadOnly
-from .filters import RoadSegmentFilter
+from .filters import RoadSegmentFilter, TrafficReadingFilter
+from .routing import get_graph
+from .bulk import upsert_segments
+from . import geohash, heatmap
+from .renderers import PlainTextRenderer
+from .throttling import render_metrics
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Largest 'older_than' accepted by the stale endpoint, about ten years in seconds.
+MAX_STALE_AGE = 10 * 365 * 24 * 60 * 60
+
+
+class SparseFieldsetViewSetMixin:
+    """
+    Only fetches the columns needed by the fields requested with '?fields='.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = requested_fields(self.request)
+        if fields is None:
+            return queryset
+        return queryset.only(*self.get_serializer_class().get_columns(fields))
 
-class RoadSegmentViewSet(viewsets.ModelViewSet):
+
+class RoadSegmentViewSet(SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows RoadSegments to be viewed or edited.
     """
@@ -30,16 +68,73 @@ class RoadSegmentViewSet(viewsets.ModelViewSet):
         count = segment.traffic_readings.count()
         return Response({'readings_count': count})
 
-    def create(self, request, *args, **kwargs):
-        print("Request body:", request.body)
-        print("Request data:", request.data)
+    @action(detail=False, methods=['get'])
+    def stale(self, request):
+        """
+        Lists the segments without readings for more than 'older_than' seconds,
+        or that never reported, as of the last coverage update.
+        """
+        try:
+            older_than = int(request.query_params.get('older_than', settings.SENSOR_STALE_AFTER))
+            if not 0 <= older_than <= MAX_STALE_AGE:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {'detail': f"'older_than' must be a number of seconds between 0 and {MAX_STALE_AGE}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        cutoff = timezone.now() - timedelta(seconds=older_than)
+        segments = (
+            RoadSegment.objects.filter(Q(coverage__isnull=True) | Q(coverage__last_seen__lt=cutoff))
+            .select_related('coverage')
+            .order_by(F('coverage__last_seen').asc(nulls_first=True), 'pk')
+        )
+        page = self.paginate_queryset(segments)
+        return self.get_paginated_response(StaleSegmentSerializer(page, many=True).data)
 
-        logger.info(f"Received a POST request with data: {request.data}")
+    @action(detail=True, methods=['get'])
+    def coverage(self, request, pk=None):
+        segment = self.get_object()
+        # Segments that never reported have no coverage row yet.
+        coverage = (
+            SegmentCoverage.objects.filter(segment=segment).first()
+            or SegmentCoverage(segment=segment)
+        )
+        return Response(SegmentCoverageSerializer(coverage).data)
+
+    def create(self, request, *args, **kwargs):
+        logger.info("Received a POST request to create a road segment.")
 
         return super().create(request, *args, **kwargs)
 
+    @action(detail=False, methods=['post'], serializer_class=RoadSegmentBulkUpsertSerializer)
+    def bulk_upsert(self, request):
+        """
+        Creates or updates many segments at once, matched by uuid or external_id.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        segments = serializer.validated_data["segments"]
+        logger.info(f"Received a bulk upsert of {len(segments)} road segments.")
+
+        try:
+            rows = upsert_segments(serializer.validated_data["key"], segments)
+        except IntegrityError as e:
+            return Response({'detail': str(e).strip()}, status=status.HTTP_400_BAD_REQUEST)
+
+        created = sum(1 for *_, was_created in rows if was_created)
+        return Response({
+            'created': created,
+            'updated': len(rows) - created,
+            'segments': [
+                {'id': segment_id, 'uuid': str(uuid), 'external_id': external_id, 'created': was_created}
+                for segment_id, uuid, external_id, was_created in rows
+            ],
+        })
 
-class TrafficReadingViewSet(viewsets.ModelViewSet):
+
+class TrafficReadingViewSet(SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows TrafficReadings to be viewed or edited.
     """
@@ -48,4 +143,129 @@ class TrafficReadingViewSet(viewsets.ModelViewSet):
     serializer_class = TrafficReadingSerializer
     permission_classes = [IsAdminUserOrReadOnly]
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ["segment"]
\ No newline at end of file
+    filterset_class = TrafficReadingFilter
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        # The deleted reading may have been the latest one of its segment.
+        transaction.on_commit(lambda: heatmap.refresh_segment(instance.segment_id))
+
+
+def parse_point(value):
+    """Parses a 'lon,lat' query parameter into a pair of floats."""
+    try:
+        lon, lat = (float(part) for part in value.split(","))
+    except (AttributeError, ValueError):
+        return None
+    if not (math.isfinite(lon) and math.isfinite(lat)):
+        return None
+    return lon, lat
+
+
+class RouteView(APIView):
+    """
+    API endpoint that returns the fastest route between two points,
+    using the latest speed of every segment.
+    """
+
+    permission_classes = [IsAdminUserOrReadOnly]
+
+    def get(self, request):
+        start = parse_point(request.query_params.get("from"))
+        end = parse_point(request.query_params.get("to"))
+        if start is None or end is None:
+            return Response(
+                {"detail": "'from' and 'to' must be given as 'lon,lat'."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        graph = get_graph()
+        if graph is None:
+            response = Response(
+                {"detail": "The road graph is being built, please retry shortly."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+            response["Retry-After"] = "5"
+            return response
+
+        source = graph.nearest_node(*start)
+        target = graph.nearest_node(*end)
+        if source is None or target is None:
+            return Response(
+                {"detail": "No road segment near the given points."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        path = graph.shortest_path(source, target)
+        if path is None:
+            return Response(
+                {"detail": "No route between the given points."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        nodes = [source] + [graph.edge_target[edge] for edge in path]
+        return Response({
+            "segments": [graph.edge_segment[edge] for edge in path],
+            "coordinates": [[graph.node_lon[node], graph.node_lat[node]] for node in nodes],
+            "length": sum(graph.edge_length[edge] for edge in path),
+            "eta_seconds": sum(graph.edge_weight[edge] for edge in path),
+        })
+
+
+class HeatmapView(APIView):
+    """
+    API endpoint that returns the average latest speed and reading volume
+    of the grid cells inside a viewport, precomputed at several zoom levels.
+    """
+
+    permission_classes = [IsAdminUserOrReadOnly]
+
+    def get(self, request):
+        try:
+            west, south, east, north = (
+                float(part) for part in request.query_params.get("bbox", "").split(",")
+            )
+            zoom = int(request.query_params.get("zoom", ""))
+            if not all(map(math.isfinite, (west, south, east, north))):
+                raise ValueError
+        except ValueError:
+            return Response(
+                {"detail": "'bbox' must be given as 'west,south,east,north' and 'zoom' as an integer."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        west, east = max(west, -180.0), min(east, 180.0)
+        south, north = max(south, -90.0), min(north, 90.0)
+
+        try:
+            precision, cells = heatmap.cells_in_bbox(west, south, east, north, zoom)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "zoom": zoom,
+            "precision": precision,
+            "cells": [
+                {
+                    "geohash": cell.geohash,
+                    "bbox": geohash.bounds(cell.geohash),
+                    "average_speed": cell.average_speed,
+                    "segments": cell.segment_count,
+                    "readings": cell.reading_count,
+                }
+                for cell in cells
+            ],
+        })
+
+
+class MetricsView(APIView):
+    """
+    Exports the throttling and load shedding counters of this process for
+    Prometheus. Restricted to staff users, e.g. with the token of a user
+    created for the scraper.
+    """
+
+    permission_classes = [IsAdminUser]
+    renderer_classes = [PlainTextRenderer]
+
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4")
@@ -0,0 +1,21 @@
+from django.db import connection
+
+from .models import TrafficReading
+
+
+def reading_snapshot():
+    """
+    Returns the highest visible reading id, with the xmin and xmax of the
+    snapshot it was seen in.
+
+    Reading ids are handed out before their transactions commit, so lower ids
+    can still become visible later. Those belong to transactions older than
+    xmax, which have all ended once the xmin of a later snapshot reaches it.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT (SELECT COALESCE(MAX(id), 0) FROM {TrafficReading._meta.db_table}), "
+            "pg_snapshot_xmin(s)::text::bigint, pg_snapshot_xmax(s)::text::bigint "
+            "FROM pg_current_snapshot() s"
+        )
+        return cursor.fetchone()